@@ -37,6 +37,7 @@ from watchdog.events import FileSystemEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 import asyncio
 import threading
+import multiprocessing
 
 import config as cfg
 import db
@@ -51,7 +52,8 @@ from env import *
 import env
 from const import *
 from graph import *
-from slim import slim_init
+import slim
+from slim import slim_init, get_toc_index, find_package, set_chunk_cache_budget
 from log import logger
 
 import sys #added by pito
@@ -1919,7 +1921,7 @@ class MainWindow:
         self.dump_menu.add_command(label="Dump all as .wem", command=self.dump_all_as_wem)
 
         self.tools_menu.add_command(label="Batch Migrate Patch Files", command=self.batch_migrate_patch)
-        if self.name_lookup is not None and os.path.exists(self.app_state.game_data_path):
+        if os.path.exists(self.app_state.game_data_path):
             self.tools_menu.add_command(label="Combine Mods", command=self.combine_mods)
         
         self.menu.add_cascade(label="File", menu=self.file_menu)
@@ -2139,14 +2141,16 @@ class MainWindow:
             if len(new_archive.text_banks) > 0:
                 archives.add("9ba626afa44a3aa3")
             missing_soundbank_ids.extend([soundbank_id for soundbank_id in new_archive.get_wwise_banks().keys()])
+        if missing_soundbank_ids:
+            self.load_toc_index()
         return patch_files, archives, missing_soundbank_ids, mod
 
     @callback
     def combine_mods_soundbank_lookup(self, files, archives, missing_soundbank_ids, mod):
         for soundbank_id in missing_soundbank_ids:
-            r = self.name_lookup.lookup_soundbank(soundbank_id)
-            if r.success:
-                archives.add(r.archive)
+            archive = self.find_soundbank_archive(soundbank_id)
+            if archive:
+                archives.add(archive)
             else:
                 showerror(title="", message="Unable to complete automated mod merging; please merge manually.")
                 self.mod_handler.delete_mod("combined_mods_temp")
@@ -2160,9 +2164,9 @@ class MainWindow:
                     except:
                         pass
                 return
-        for archive in archives:
-            archive = os.path.join(self.app_state.game_data_path, archive)
-            self.task_manager.schedule(name=f"Loading Archive {os.path.basename(archive)}", callback=None, task=task(mod.load_archive_file), archive_file=archive)
+        if archives:
+            archive_files = [os.path.join(self.app_state.game_data_path, archive) for archive in archives]
+            self.task_manager.schedule(name="Loading Archives", callback=None, task=task(mod.load_archive_files), archive_files=archive_files)
         for file in files:
             self.task_manager.schedule(name=f"Applying Patch {file}", callback=None, task=task(mod.import_patch), patch_file=file)
         self.task_manager.schedule(name="Saving Output File", callback=None, task=self.combine_mods_write_output, mod=mod)
@@ -2202,6 +2206,27 @@ class MainWindow:
     def combine_mods_cleanup(self):
         pass
 
+    def load_toc_index(self):
+        # scans the toc of every package in the game data folder the first time; later calls load the saved index
+        if not os.path.exists(self.app_state.game_data_path):
+            return
+        try:
+            get_toc_index()
+        except Exception as e:
+            logger.error(f"Unable to index the game data folder: {e}")
+
+    def find_soundbank_archive(self, soundbank_id: int) -> str:
+        # the name DB is checked first; the toc index of the game data folder covers soundbanks missing from it
+        if self.name_lookup is not None:
+            r = self.name_lookup.lookup_soundbank(soundbank_id)
+            if r.success:
+                return r.archive
+        try:
+            return find_package(soundbank_id, WWISE_BANK)
+        except Exception as e:
+            logger.error(f"Unable to index the game data folder: {e}")
+            return ""
+
     def batch_migrate_patch(self):
         """
         Batch migrate patch files to update their versions.
@@ -2251,6 +2276,11 @@ class MainWindow:
             tkinter.messagebox.showerror("Backup Error", f"Failed to create backup: {str(e)}")
             return
 
+        # finding the archives of the patched banks may scan the data folder, so the migration runs off the UI thread
+        self.task_manager.schedule(name="Migrating Patches", callback=self.batch_migrate_patch_finished, task=self.batch_migrate_patch_task, patch_files=patch_files, backup_dir=backup_dir)
+
+    @task
+    def batch_migrate_patch_task(self, patch_files, backup_dir):
         migrated_count = 0
         failed_count = 0
 
@@ -2263,18 +2293,16 @@ class MainWindow:
                 patch_text = patch_content.get_text_banks()
                 if len(patch_text) > 0:
                     archives.add("9ba626afa44a3aa3")
-                if self.name_lookup is not None and os.path.exists(self.app_state.game_data_path):
+                if os.path.exists(self.app_state.game_data_path):
                     for soundbank_id in patch_soundbanks.keys():
-                        r = self.name_lookup.lookup_soundbank(soundbank_id)
-                        if r.success:
-                            archives.add(r.archive)
+                        archive = self.find_soundbank_archive(soundbank_id)
+                        if archive:
+                            archives.add(archive)
                         else:  # migration failure
                             raise Exception(
                                 f"Unable to locate archive for soundbank {patch_soundbanks[soundbank_id].dep.data}")
 
-                for archive in archives:
-                    archive = os.path.join(self.app_state.game_data_path, archive)
-                    migration_mod.load_archive_file(archive)
+                migration_mod.load_archive_files([os.path.join(self.app_state.game_data_path, archive) for archive in archives])
                 migration_mod.import_patch(patch_file)
 
                 # Export the updated patch
@@ -2289,6 +2317,10 @@ class MainWindow:
                 logger.error(f"Failed to migrate {patch_file}: {str(e)}")
                 continue
 
+        return migrated_count, failed_count, backup_dir
+
+    @callback
+    def batch_migrate_patch_finished(self, migrated_count, failed_count, backup_dir):
         # Show results
         result_message = (
             f"Migration completed!\n\n"
@@ -3308,10 +3340,8 @@ class MainWindow:
     
     @task
     def load_archive_task(self, archive_files: list[str] = []):
-        results = []
-        for archive_file in archive_files:
-            results.append((self.mod_handler.get_active_mod().load_archive_file(archive_file=archive_file), archive_file))
-        return results
+        results = self.mod_handler.get_active_mod().load_archive_files(archive_files)
+        return list(zip(results, archive_files))
     
     @callback
     def load_archive_task_finished(self, results):
@@ -3459,7 +3489,7 @@ class MainWindow:
         for bank in self.mod_handler.get_active_mod().get_wwise_banks().values():
             bank_folder = os.path.join(task_folder, bank.dep.data.replace("\x00", "").split("/")[-1])
             os.mkdir(bank_folder)
-            file_ids = bank.get_content()
+            file_ids = list(bank.get_content())
             task_id = self.generate_task_id()
             self.active_task_ids.append(task_id)
             self.task_manager.schedule(name="Initializing File Dump", callback=None, task=self.dump_as_wav_setup_task, task_id=task_id, file_ids=file_ids, output_location=bank_folder, with_seq=False)
@@ -3524,6 +3554,8 @@ class MainWindow:
     def import_patch_task(self, archive_file: str = ""):
         new_archive = GameArchive.from_file(archive_file)
         missing_soundbank_ids = [soundbank_id for soundbank_id in new_archive.get_wwise_banks().keys() if soundbank_id not in self.mod_handler.get_active_mod().get_wwise_banks()]
+        if missing_soundbank_ids:
+            self.load_toc_index()
         return missing_soundbank_ids, new_archive, archive_file
     
     @callback
@@ -3532,18 +3564,18 @@ class MainWindow:
         missing_soundbanks = set()
         if len(new_archive.text_banks) > 0 and "9ba626afa44a3aa3" not in self.mod_handler.get_active_mod().get_game_archives().keys():
             archives.add("9ba626afa44a3aa3")
-        if self.name_lookup is not None and os.path.exists(self.app_state.game_data_path):
+        if os.path.exists(self.app_state.game_data_path):
             for soundbank_id in missing_soundbank_ids:
-                r = self.name_lookup.lookup_soundbank(soundbank_id)
-                if r.success:
-                    archives.add(r.archive)
+                archive = self.find_soundbank_archive(soundbank_id)
+                if archive:
+                    archives.add(archive)
                 else:
                     missing_soundbanks.add(new_archive.get_wwise_banks()[soundbank_id])
         #if len(missing_soundbanks) > 0:
         #    showwarning(title="Missing Soundbanks", message="Could not automatically load all soundbanks in the patch; it may be outdated. Please ensure any needed archives are manually loaded before importing this patch.\n" + "\n".join([bank.dep.data.replace("\x00", "") for bank in missing_soundbanks]))
-        for archive in archives:
-            archive = os.path.join(self.app_state.game_data_path, archive)
-            self.task_manager.schedule(name=f"Loading Archive {os.path.basename(archive)}", callback=self.import_patch_load_archive_finished, task=self.load_archive_task, archive_files=[archive])
+        if archives:
+            archive_files = [os.path.join(self.app_state.game_data_path, archive) for archive in archives]
+            self.task_manager.schedule(name="Loading Archives", callback=self.import_patch_load_archive_finished, task=self.load_archive_task, archive_files=archive_files)
         reload_view = False
         for video in new_archive.video_sources.values():
             if video.file_id not in self.mod_handler.get_active_mod().get_video_sources().keys():
@@ -3616,6 +3648,8 @@ def wwise_setup(app_state, show_warnings=False):
 
 
 if __name__ == "__main__":
+    # slim scans packages in worker processes, which frozen builds can only start after this
+    multiprocessing.freeze_support()
     logger.setLevel(logging.INFO)
     random.seed()
     app_state: cfg.Config | None = cfg.load_config()
@@ -3775,8 +3809,10 @@ if __name__ == "__main__":
     except:
         pass
     
+    set_chunk_cache_budget(app_state.chunk_cache_budget * 1024 * 1024)
     try:
-        slim_init(app_state.game_data_path)
+        slim.toc_index_path = TOC_INDEX_CACHE
+        slim_init(app_state.game_data_path, BUNDLE_INDEX_CACHE)
     except FileNotFoundError:
         logger.warning("Unable to initialize slim decompression module; game data path may be invalid")
         
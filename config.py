@@ -16,7 +16,8 @@ class Config:
                  rowheight_scale: float = 1.0,
                  rad_tools_path: str = "",
                  wwise_path: str = "",
-                 workspace_paths: set[str] = set()):
+                 workspace_paths: set[str] = set(),
+                 chunk_cache_budget: int = 256):
         self.game_data_path = game_data_path
         self.rad_tools_path = rad_tools_path
         self.wwise_path = wwise_path
@@ -25,6 +26,8 @@ class Config:
         self.ui_scale = ui_scale
         self.rowheight_scale = rowheight_scale
         self.workspace_paths = workspace_paths
+        # MiB of decompressed bundle chunks slim keeps in memory; 0 disables the cache
+        self.chunk_cache_budget = chunk_cache_budget
 
     """
     @return (int): A status code to tell whether there are new workspace being 
@@ -86,6 +89,7 @@ def load_config(config_path: str = "config.pickle") -> Config | None:
         cfg.rad_tools_path = cfg.get("rad_tools_path", "")
         cfg.wwise_path = cfg.get("wwise_path", "")
         cfg.rowheight_scale = cfg.get("rowheight_scale", 1.0)
+        cfg.chunk_cache_budget = cfg.get("chunk_cache_budget", 256)
         cfg.recent_files = cfg.get("recent_files", [])
         cfg.recent_files = [file for file in cfg.recent_files if os.path.exists(file)]
         cfg.save_config()
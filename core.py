@@ -7,12 +7,14 @@ import wave
 import copy
 import locale
 import random
+import gc
 import xml.etree.ElementTree as etree
 import posixpath as xpath
 import asyncio
 import json #added by pito
 
-from typing import Callable, Literal, Union
+from typing import BinaryIO, Callable, Iterable, KeysView, Literal, Union
+from concurrent.futures import ProcessPoolExecutor
 
 from backend.db import SQLiteDatabase
 from const import *
@@ -24,10 +26,161 @@ import wwise_hierarchy_140
 import wwise_hierarchy_154
 from wwise_hierarchy_154 import WwiseHierarchy_154
 from wwise_hierarchy_140 import WwiseHierarchy_140
-from slim import load_package
+from slim import load_package, PackageStream, TOC_ENTRY_DTYPE
+import slim
 
 from log import logger
 
+# number of processes Mod.load_archive_files loads archives in. Off by default: the loaded archives are
+# pickled back to this process, which takes longer to unpickle them than to load them, and their mapped
+# data is copied on the way
+archive_load_workers = 1
+
+# stream resource ids are murmur64 hashes of "<bank folder>/<source id>". They are kept per bank folder for
+# the session and saved to stream_resource_id_cache_path; set it to "" to keep them in memory only
+STREAM_ID_CACHE_MAGIC = b"SRID"
+STREAM_ID_CACHE_VERSION = 1
+STREAM_ID_DTYPE = numpy.dtype([("source_id", "<u4"), ("resource_id", "<u8")])
+stream_resource_id_cache_path = STREAM_ID_CACHE
+stream_resource_ids: dict[str, dict[int, int]] | None = None
+stream_resource_ids_changed = False
+
+def get_folder_stream_resource_ids(bank_folder: str) -> dict[int, int]:
+    global stream_resource_ids
+    if stream_resource_ids is None:
+        stream_resource_ids = load_stream_resource_ids(stream_resource_id_cache_path) if stream_resource_id_cache_path else {}
+    try:
+        return stream_resource_ids[bank_folder]
+    except KeyError:
+        folder_ids = stream_resource_ids[bank_folder] = {}
+        return folder_ids
+
+def get_stream_resource_id(bank_folder: str, source_id: int) -> int:
+    global stream_resource_ids_changed
+    folder_ids = get_folder_stream_resource_ids(bank_folder)
+    try:
+        return folder_ids[source_id]
+    except KeyError:
+        pass
+    resource_id = murmur64_hash((bank_folder + "/" + str(source_id)).encode('utf-8'))
+    folder_ids[source_id] = resource_id
+    stream_resource_ids_changed = True
+    return resource_id
+
+def add_stream_resource_ids(bank_folder: str, source_ids: Iterable[int]):
+
+    # hashes the ids that are not cached yet in one batch
+
+    global stream_resource_ids_changed
+    folder_ids = get_folder_stream_resource_ids(bank_folder)
+    missing = [source_id for source_id in dict.fromkeys(source_ids) if source_id not in folder_ids]
+    if not missing:
+        return
+    resource_ids = murmur64_hash_many([(bank_folder + "/" + str(source_id)).encode('utf-8') for source_id in missing])
+    folder_ids.update(zip(missing, resource_ids))
+    stream_resource_ids_changed = True
+
+def add_archive_stream_resource_ids(archive: 'GameArchive'):
+
+    # records the stream resource ids of an archive loaded in another process, which did not save them
+
+    global stream_resource_ids_changed
+    for bank in archive.wwise_banks.values():
+        if bank.dep == None:
+            continue
+        folder_ids = get_folder_stream_resource_ids(os.path.dirname(bank.dep.data))
+        for source_id in bank.get_content():
+            audio = archive.audio_sources.get(source_id)
+            if audio != None and audio.resource_id and source_id not in folder_ids:
+                folder_ids[source_id] = audio.resource_id
+                stream_resource_ids_changed = True
+
+def load_stream_resource_ids(cache_path: str) -> dict[str, dict[int, int]]:
+
+    # returns an empty cache if the file is missing or corrupt
+
+    resource_ids = {}
+    try:
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+        magic, version, num_folders = struct.unpack_from("<4sII", data, 0)
+        if magic != STREAM_ID_CACHE_MAGIC or version != STREAM_ID_CACHE_VERSION:
+            return {}
+        offset = 12
+        for _ in range(num_folders):
+            name_length, count = struct.unpack_from("<HI", data, offset)
+            offset += 6
+            bank_folder = data[offset:offset+name_length].decode('utf-8')
+            offset += name_length
+            records = numpy.frombuffer(data, dtype=STREAM_ID_DTYPE, count=count, offset=offset)
+            offset += records.nbytes
+            resource_ids[bank_folder] = dict(zip(records["source_id"].tolist(), records["resource_id"].tolist()))
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return {}
+    return resource_ids
+
+def save_stream_resource_ids(cache_path: str = ""):
+
+    # layout (little endian): magic, version, folder count, then per folder
+    # name length, id count, name and STREAM_ID_DTYPE records
+
+    global stream_resource_ids_changed
+    cache_path = cache_path or stream_resource_id_cache_path
+    if not cache_path or not stream_resource_ids:
+        return
+    data = [struct.pack("<4sII", STREAM_ID_CACHE_MAGIC, STREAM_ID_CACHE_VERSION, len(stream_resource_ids))]
+    for bank_folder, folder_ids in stream_resource_ids.items():
+        name = bank_folder.encode('utf-8')
+        records = numpy.empty(len(folder_ids), dtype=STREAM_ID_DTYPE)
+        records["source_id"] = list(folder_ids.keys())
+        records["resource_id"] = list(folder_ids.values())
+        data.append(struct.pack("<HI", len(name), len(folder_ids)))
+        data.append(name)
+        data.append(records.tobytes())
+    # each process writes its own temporary file, so two instances of the app never write to the same one
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(data))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Unable to save stream resource ids: {e}")
+        return
+    stream_resource_ids_changed = False
+
+def init_archive_load_worker(game_data_folder: str, index_cache_path: str):
+    global stream_resource_id_cache_path
+    # worker processes start with fresh module state. They neither load nor save the stream resource
+    # ids, so they don't overwrite each other's; hashing the ids of an archive takes milliseconds
+    stream_resource_id_cache_path = ""
+    try:
+        slim.slim_init(game_data_folder, index_cache_path, save_index=False)
+    except FileNotFoundError:
+        logger.warning("Unable to initialize slim decompression module; game data path may be invalid")
+
+def load_game_archive(path: str, lazy_hierarchy: bool = False) -> Union['GameArchive', None]:
+    return GameArchive.from_file(path, lazy_hierarchy)
+
+def parse_hierarchy(
+    bank_version: int,
+    hierarchy_data: bytes | bytearray | memoryview | None,
+    soundbank: Union['WwiseBank', None] = None,
+    lazy: bool = False
+) -> WwiseHierarchy_154 | WwiseHierarchy_140:
+    """
+    Parse the HIRC chunk of a bank. See WwiseHierarchy_154.load for lazy
+    """
+    if bank_version == 154:
+        hirc = WwiseHierarchy_154(soundbank=soundbank)
+    else:
+        hirc = WwiseHierarchy_140(soundbank=soundbank)
+    if hierarchy_data is not None:
+        try:
+            hirc.load(hierarchy_data, lazy=lazy)
+        except KeyError:
+            pass
+    return hirc
+
 class VideoSource:
 
     def __init__(self):
@@ -45,8 +198,8 @@ class VideoSource:
 
     def get_data(self):
         if not self.modified:
-            _, _, stream_data = load_package(self.filepath)
-            return stream_data[self.stream_offset:self.stream_offset+self.video_size]
+            _, _, stream_data = load_package(self.filepath, toc_only=True)
+            return stream_data.read_range(self.stream_offset, self.video_size)
         else:
             with open(self.replacement_filepath, "rb") as f:
                 f.seek(self.replacement_video_offset)
@@ -57,13 +210,20 @@ class VideoSource:
         self.replacement_video_size = os.path.getsize(replacement_filepath)
         self.modified = True
 
+    def get_size(self) -> int:
+        return self.replacement_video_size if self.modified else self.video_size
+
+    def read_data(self):
+        return self.get_data()
+
     def get_id(self):
         return self.file_id
 
 class AudioSource:
 
     def __init__(self):
-        self.data: bytearray | Literal[b""] = b""
+        self.lazy_data: tuple[PackageStream, int, int] | None = None
+        self.data: bytearray | memoryview | Literal[b""] = b""
         self.size: int = 0
         self.resource_id: int = 0
         self.short_id: int = 0
@@ -72,6 +232,31 @@ class AudioSource:
         self.parents: set[wwise_hierarchy_154.HircEntry | wwise_hierarchy_140.HircEntry | WwiseStream] = set()
         self.stream_type: int = 0
         self.muted = False
+
+    def __getstate__(self):
+        # views into mapped package data are copied when the source is sent to another process
+        return {k: bytes(v) if isinstance(v, memoryview) else v for k, v in self.__dict__.items()}
+
+    @property
+    def data(self) -> bytearray | memoryview | Literal[b""]:
+        if self.lazy_data != None:
+            stream, offset, size = self.lazy_data
+            self.lazy_data = None
+            self._data = stream.read_range(offset, size)
+        return self._data
+
+    @data.setter
+    def data(self, data: bytearray | Literal[b""]):
+        self.lazy_data = None
+        self._data = data
+
+    def set_lazy_data(self, stream: PackageStream, offset: int, size: int):
+        """
+        Defer reading the audio data until it is first accessed
+        """
+        self.data = b""
+        self.lazy_data = (stream, offset, size)
+        self.size = size
         
     def set_data(self, data: bytearray, notify_subscribers: bool = True, set_modified: bool = True):
         if not self.modified and set_modified:
@@ -85,6 +270,9 @@ class AudioSource:
                     if isinstance(item, (wwise_hierarchy_154.HircEntry, wwise_hierarchy_140.HircEntry)):
                         for bank in item.soundbanks:
                             bank.raise_modified()
+                elif isinstance(item, (wwise_hierarchy_154.HircEntry, wwise_hierarchy_140.HircEntry)):
+                    for bank in item.soundbanks:
+                        bank.invalidate()
         if set_modified:
             self.modified = True
             
@@ -102,6 +290,19 @@ class AudioSource:
             return bytearray() if self.data == b"" else self.data 
         else:
             return b"" # returns wem with no samples
+
+    def get_size(self) -> int:
+        return 0 if self.muted else self.size
+
+    def read_data(self) -> bytearray | memoryview | bytes:
+        """
+        Same as get_data, but data that has not been loaded yet is read without
+        being kept in memory afterwards
+        """
+        if self.lazy_data != None and not self.muted:
+            stream, offset, size = self.lazy_data
+            return stream.read_range(offset, size)
+        return self.get_data()
         
     def get_resource_id(self) -> int:
         return self.resource_id
@@ -126,6 +327,22 @@ class AudioSource:
 
 class TocHeader:
 
+    __slots__ = (
+        "file_id",
+        "type_id",
+        "toc_data_offset",
+        "stream_file_offset",
+        "gpu_resource_offset",
+        "unknown1",
+        "unknown2",
+        "toc_data_size",
+        "stream_size",
+        "gpu_resource_size",
+        "unknown3",
+        "unknown4",
+        "entry_index",
+    )
+
     def __init__(self):
         self.file_id = self.type_id = self.toc_data_offset = self.stream_file_offset = self.gpu_resource_offset = 0
         self.unknown1 = self.unknown2 = self.toc_data_size = self.stream_size = self.gpu_resource_size = 0
@@ -163,6 +380,14 @@ class TocHeader:
             self.unknown3,
             self.unknown4,
             self.entry_index))
+
+    @staticmethod
+    def record(file_id: int, type_id: int, toc_data_offset: int, stream_file_offset: int,
+               toc_data_size: int, stream_size: int, entry_index: int) -> tuple:
+        """
+        Row of a toc table with the default values of the fields the game does not need
+        """
+        return (file_id, type_id, toc_data_offset, stream_file_offset, 0, 0, 0, toc_data_size, stream_size, 0, 16, 64, entry_index)
                 
 
 class WwiseDep:
@@ -177,7 +402,7 @@ class WwiseDep:
         self.tag = stream.uint32_read()
         self.data_size = stream.uint32_read()
         self.skip = False
-        self.data = stream.read(self.data_size).decode('utf-8')
+        self.data = bytes(stream.read(self.data_size)).decode('utf-8')
         
     def get_data(self) -> bytes:
         return (self.tag.to_bytes(4, byteorder='little')
@@ -186,6 +411,8 @@ class WwiseDep:
                 
 
 class DidxEntry:
+    __slots__ = ("id", "offset", "size")
+
     def __init__(self):
         self.id = self.offset = self.size = 0
         
@@ -222,21 +449,22 @@ class BankParser:
     def __init__(self):
         self.chunks = {}
         
-    def load(self, bank_data: bytes | bytearray):
+    def load(self, bank_data: bytes | bytearray | memoryview):
+        """
+        Chunks are memoryviews into bank_data; nothing is copied
+        """
         self.chunks.clear()
-        reader = MemoryStream()
-        reader.write(bank_data)
-        reader.seek(0)
+        reader = MemoryViewStream(bank_data)
         while True:
             tag = ""
             try:
-                tag = reader.read(4).decode('utf-8')
+                tag = bytes(reader.read(4)).decode('utf-8')
             except:
                 break
             size = reader.uint32_read()
             self.chunks[tag] = reader.read(size)
             
-    def GetChunk(self, chunk_tag: str) -> bytearray:
+    def GetChunk(self, chunk_tag: str) -> bytearray | memoryview:
         try:
             return self.chunks[chunk_tag]
         except:
@@ -262,15 +490,15 @@ class DummyBank:
             didx_array.append(struct.pack("<III", audio.get_short_id(), offset, audio.size))
             offset += audio.size
         
-        data = bytearray()
-        data += self.header
-        data += "DIDX".encode('utf-8') + (12*len(didx_array)).to_bytes(4, byteorder="little")
-        data += b"".join(didx_array)
-        data += "DATA".encode('utf-8') + sum([len(x) for x in data_array]).to_bytes(4, byteorder="little")
-        data += b"".join(data_array)
+        data = BufferList()
+        data.append(self.header)
+        data.append("DIDX".encode('utf-8') + (12*len(didx_array)).to_bytes(4, byteorder="little"))
+        data.append(b"".join(didx_array))
+        data.append("DATA".encode('utf-8') + sum([len(x) for x in data_array]).to_bytes(4, byteorder="little"))
+        data.append(BufferList(data_array))
             
         with open(filepath, "wb") as f:
-            f.write(data)
+            data.write_to(f)
 
 
 class WwiseBank:
@@ -282,9 +510,17 @@ class WwiseBank:
         self.dep: WwiseDep | None = None
         self.modified_count: int = 0
         self.hierarchy: WwiseHierarchy_154 | None = None
-        self.content: list[int] = []
+        # audio source ids in insertion order, used as an ordered set
+        self.content: dict[int, None] = {}
         self.media_index = None
         self.file_id: int = 0
+        self.original_data: bytes | memoryview | None = None
+        # output of the last generate and the audio sources it looked up
+        self.generated_data: BufferList | None = None
+        self.generated_sources: list[tuple[int, AudioSource | None]] = []
+
+    def __getstate__(self):
+        return {k: bytes(v) if isinstance(v, memoryview) else v for k, v in self.__dict__.items()}
         
     def import_hierarchy(self, new_hierarchy: WwiseHierarchy_154):
         if self.hierarchy == None:
@@ -295,26 +531,33 @@ class WwiseBank:
         self.hierarchy.import_hierarchy(new_hierarchy)
         
     def add_content(self, content: int):
-        self.content.append(content)
+        self.content[content] = None
         
     def remove_content(self, content: int):
-        try:
-            self.content.remove(content)
-        except:
-            pass
-            
-    def get_content(self) -> list[int]:
-        return self.content
+        self.content.pop(content, None)
+
+    def get_content(self) -> KeysView[int]:
+        return self.content.keys()
         
     def raise_modified(self):
         self.modified = True
         self.modified_count += 1
+        self.invalidate()
         
     def lower_modified(self):
         if self.modified:
             self.modified_count -= 1
             if self.modified_count == 0:
                 self.modified = False
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Drop the cached output of generate. Must be called whenever something
+        the bank is generated from changes without going through raise_modified
+        """
+        self.generated_data = None
+        self.generated_sources = []
         
     def get_name(self) -> str:
         if self.dep == None:
@@ -330,14 +573,27 @@ class WwiseBank:
         except:
             return 0
             
-    def generate(self, audio_sources) -> bytearray:
+    def generate(self, audio_sources) -> BufferList:
+        """
+        The result is cached until the bank is invalidated, and is reused as long
+        as audio_sources maps the bank's sources to the same AudioSource objects
+
+        The bank is returned as a BufferList that references the audio data
+        instead of copying it
+        """
         if self.hierarchy == None:
             raise AssertionError(
                 f"No WwiseHierarchy is attach to WwiseBank {self.file_id}"
             )
 
-        data = bytearray()
-        data += self.bank_header
+        if self.generated_data is not None and all(
+            audio_sources.get(source_id) is audio for source_id, audio in self.generated_sources
+        ):
+            return self.generated_data
+
+        generated_sources = []
+        data = BufferList()
+        data.append(self.bank_header)
         offset = 0
         
         #regenerate soundbank from the hierarchy information
@@ -355,12 +611,12 @@ class WwiseBank:
                         continue
                     if self.media_index and source.source_id not in self.media_index:
                         continue
-                    try:
-                        audio = audio_sources[source.source_id]
-                    except KeyError as _:
+                    audio = audio_sources.get(source.source_id)
+                    generated_sources.append((source.source_id, audio))
+                    if audio is None:
                         continue
                     if source.stream_type == PREFETCH_STREAM and source.source_id not in added_sources:
-                        data_array.append(audio.get_data()[:source.mem_size])
+                        data_array.append(memoryview(audio.get_data())[:source.mem_size])
                         didx_array.append(struct.pack("<III", source.source_id, offset, source.mem_size))
                         offset += source.mem_size
                         added_sources.add(source.source_id)
@@ -375,9 +631,12 @@ class WwiseBank:
                         fx_data = custom_fx_entry.get_data()
                         plugin_param_size = int.from_bytes(fx_data[13:17], byteorder="little")
                         media_index_id = int.from_bytes(fx_data[19+plugin_param_size:23+plugin_param_size], byteorder="little")
-                        audio = audio_sources[media_index_id]
                     except KeyError:
                         continue
+                    audio = audio_sources.get(media_index_id)
+                    generated_sources.append((media_index_id, audio))
+                    if audio is None:
+                        continue
                     if source.stream_type == BANK and source.source_id not in added_sources:
                         data_array.append(audio.get_data())
                         didx_array.append(struct.pack("<III", media_index_id, offset, audio.size))
@@ -385,16 +644,27 @@ class WwiseBank:
                         added_sources.add(media_index_id)
                         
         if len(didx_array) > 0:
-            data += "DIDX".encode('utf-8') + (12*len(didx_array)).to_bytes(4, byteorder="little")
-            data += b"".join(didx_array)
-            data += "DATA".encode('utf-8') + sum([len(x) for x in data_array]).to_bytes(4, byteorder="little")
-            data += b"".join(data_array)
+            data.append("DIDX".encode('utf-8') + (12*len(didx_array)).to_bytes(4, byteorder="little"))
+            data.append(b"".join(didx_array))
+            data.append("DATA".encode('utf-8') + sum([len(x) for x in data_array]).to_bytes(4, byteorder="little"))
+            data.append(BufferList(data_array))
             
         hierarchy_section = self.hierarchy.get_data()
-        data += "HIRC".encode('utf-8') + len(hierarchy_section).to_bytes(4, byteorder="little")
-        data += hierarchy_section
-        data += self.bank_misc_data
+        data.append("HIRC".encode('utf-8') + len(hierarchy_section).to_bytes(4, byteorder="little"))
+        data.append(hierarchy_section)
+        data.append(self.bank_misc_data)
+        self.generated_data = data
+        self.generated_sources = generated_sources
         return data
+
+    def get_toc_data(self, audio_sources) -> bytes | bytearray | memoryview | BufferList:
+        """
+        Return the bank as stored in the toc file. An unmodified bank loaded
+        from an archive is returned as is instead of being regenerated
+        """
+        if self.modified or self.original_data is None:
+            return self.generate(audio_sources)
+        return self.original_data
         
 
 class WwiseStream:
@@ -429,9 +699,25 @@ class WwiseStream:
             )
         return self.audio_source.get_data()
 
+    def get_size(self) -> int:
+        if self.audio_source == None:
+            raise AssertionError(
+                f"No audio source is attached to WwiseStream {self.file_id}"
+            )
+        return self.audio_source.get_size()
+
+    def read_data(self) -> bytearray | memoryview | bytes:
+        if self.audio_source == None:
+            raise AssertionError(
+                f"No audio source is attached to WwiseStream {self.file_id}"
+            )
+        return self.audio_source.read_data()
+
 
 class StringEntry:
 
+    __slots__ = ("text", "text_old", "string_id", "modified", "parent")
+
     def __init__(self):
         self.text = ""
         self.text_old = ""
@@ -501,6 +787,7 @@ class TextBank:
         self.language = 0
         self.modified = False
         self.modified_count = 0
+        self.original_data: bytes | memoryview | None = None
      
     def set_data(self, data: bytearray):
         self.entries.clear()
@@ -567,6 +854,15 @@ class TextBank:
             offset += len(text_bytes)
             stream.seek(initial_position)
         return stream.data
+
+    def get_toc_data(self) -> bytes | bytearray | memoryview:
+        """
+        Return the text bank as stored in the toc file. An unmodified text bank
+        loaded from an archive is returned as is instead of being regenerated
+        """
+        if self.modified or self.original_data is None:
+            return self.generate()
+        return self.original_data
         
     def get_id(self) -> int:
         return self.file_id
@@ -599,17 +895,16 @@ class GameArchive:
         self.text_banks = {}
     
     @classmethod
-    def from_file(cls, path: str) -> 'GameArchive': 
+    def from_file(cls, path: str, lazy_hierarchy: bool = False) -> 'GameArchive': 
         archive = GameArchive()
         archive.name = os.path.basename(path)
         archive.path = path
         
-        toc_data, _, stream_data = load_package(path)
+        toc_data, _, stream_file = load_package(path, toc_only=True)
         if not toc_data:
             return None
-        toc_file = MemoryStream(toc_data)
-        stream_file = MemoryStream(stream_data)
-        archive.load(toc_file, stream_file)
+        toc_file = MemoryViewStream(toc_data)
+        archive.load(toc_file, stream_file, lazy_hierarchy)
         return archive
         
     def get_wwise_streams(self) -> dict[int, WwiseStream]:
@@ -630,13 +925,21 @@ class GameArchive:
     def get_hierarchy_entries(self) -> dict[int, wwise_hierarchy_140.HircEntry | wwise_hierarchy_154.HircEntry]:
         return self.hierarchy_entries
 
-    def write_type_header(self, toc_file: MemoryStream, entry_type: int, num_entries: int):
+    def write_type_header(self, toc_file: MemoryStream | BinaryIO, entry_type: int, num_entries: int):
         if num_entries > 0:
             toc_file.write(struct.pack("<QQQII", 0, entry_type, num_entries, 16, 64))
         
     def to_file(self, path: str):
-        toc_file = MemoryStream()
-        stream_file = MemoryStream()
+        """
+        The archive is written in two passes. The first lays out every toc entry
+        from the payload sizes, the second writes the payloads to the output
+        files in order, reading stream and video data one entry at a time
+
+        @exception
+        - RuntimeError
+            - The size of a stream or video changed while it was being written.
+            The existing files are left untouched
+        """
         wwise_deps = [bank.dep for bank in self.wwise_banks.values() if not bank.dep.skip]
         self.num_files = len(self.wwise_streams) + len(self.wwise_banks) + len(wwise_deps) + len(self.text_banks) + len(self.video_sources)
         self.num_types = 0
@@ -644,126 +947,151 @@ class GameArchive:
             if item:
                 self.num_types += 1
         
-        # write header
-        toc_file.write(struct.pack("<IIII56s", self.magic, self.num_types, self.num_files, self.unknown, self.unk4Data))
-        
-        self.write_type_header(toc_file, WWISE_STREAM, len(self.wwise_streams))
-        self.write_type_header(toc_file, WWISE_BANK, len(self.wwise_banks))
-        self.write_type_header(toc_file, WWISE_DEP, len(wwise_deps))
-        self.write_type_header(toc_file, TEXT_BANK, len(self.text_banks))
-        self.write_type_header(toc_file, BINK_VIDEO, len(self.video_sources))
-        
-        toc_data_offset = toc_file.tell() + 80 * self.num_files + 8
+        toc_data_offset = 72 + 32 * self.num_types + 80 * self.num_files + 8
         stream_file_offset = 0
         
-        # generate data and toc entries
-        toc_entries = []
-        toc_data = []
-        stream_data = []
+        # first pass: lay out the toc entries. toc data is small and is kept until
+        # it is written, stream data is only sized here
+        toc_entries: list[tuple] = []
+        toc_data: list[bytes | bytearray | memoryview | BufferList] = []
+        stream_sources: list[tuple[WwiseStream | VideoSource, int]] = []
         entry_index = 0
         
         for stream in self.wwise_streams.values():
-            s_data = pad_to_16_byte_align(stream.get_data())
-            t_data = bytes.fromhex("D82F767800000000") + struct.pack("<Q", len(stream.get_data()))
-            toc_entry = TocHeader()
-            toc_entry.file_id = stream.get_id()
-            toc_entry.type_id = WWISE_STREAM
-            toc_entry.toc_data_offset = toc_data_offset
-            toc_entry.stream_file_offset = stream_file_offset
-            toc_entry.toc_data_size = 0x0C
-            toc_entry.stream_size = len(stream.get_data())
-            toc_entry.entry_index = entry_index
-            stream_data.append(s_data)
-            toc_data.append(t_data)
-            toc_entries.append(toc_entry)
+            size = stream.get_size()
+            toc_entries.append(TocHeader.record(stream.get_id(), WWISE_STREAM, toc_data_offset, stream_file_offset, 0x0C, size, entry_index))
+            toc_data.append(bytes.fromhex("D82F767800000000") + struct.pack("<Q", size))
+            stream_sources.append((stream, size))
             entry_index += 1
-            stream_file_offset += len(s_data)
+            stream_file_offset += align_16_byte(size)
             toc_data_offset += 16
             
-        
         for bank in self.wwise_banks.values():
-            bank_data = bank.generate(self.audio_sources)
-            toc_entry = TocHeader()
-            toc_entry.file_id = bank.get_id()
-            toc_entry.type_id = WWISE_BANK
-            toc_entry.toc_data_offset = toc_data_offset
-            toc_entry.stream_file_offset = stream_file_offset
-            toc_entry.toc_data_size = len(bank_data) + 16
-            toc_entry.entry_index = entry_index
-            toc_entries.append(toc_entry)
-            bank_data = b"".join([bytes.fromhex("D82F7678"), len(bank_data).to_bytes(4, byteorder="little"), bank.get_id().to_bytes(8, byteorder="little"), pad_to_16_byte_align(bank_data)])
+            bank_data = bank.get_toc_data(self.audio_sources)
+            toc_entries.append(TocHeader.record(bank.get_id(), WWISE_BANK, toc_data_offset, stream_file_offset, len(bank_data) + 16, 0, entry_index))
+            toc_data.append(b"".join([bytes.fromhex("D82F7678"), len(bank_data).to_bytes(4, byteorder="little"), bank.get_id().to_bytes(8, byteorder="little")]))
             toc_data.append(bank_data)
             
-            toc_data_offset += len(bank_data)
+            toc_data_offset += align_16_byte(len(bank_data) + 16)
             entry_index += 1
+            del bank_data
             
         for text_bank in self.text_banks.values():
-            text_data = text_bank.generate()
-            toc_entry = TocHeader()
-            toc_entry.file_id = text_bank.get_id()
-            toc_entry.type_id = TEXT_BANK
-            toc_entry.toc_data_offset = toc_data_offset
-            toc_entry.stream_file_offset = stream_file_offset
-            toc_entry.toc_data_size = len(text_data)
-            toc_entry.entry_index = entry_index
-            text_data = pad_to_16_byte_align(text_data)
-            
-            toc_entries.append(toc_entry)
+            text_data = text_bank.get_toc_data()
+            toc_entries.append(TocHeader.record(text_bank.get_id(), TEXT_BANK, toc_data_offset, stream_file_offset, len(text_data), 0, entry_index))
             toc_data.append(text_data)
             
-            toc_data_offset += len(text_data)
+            toc_data_offset += align_16_byte(len(text_data))
             entry_index += 1
         
         for dep in wwise_deps:
             dep_data = dep.get_data()
-            toc_entry = TocHeader()
-            toc_entry.file_id = dep.file_id
-            toc_entry.type_id = WWISE_DEP
-            toc_entry.toc_data_offset = toc_data_offset
-            toc_entry.stream_file_offset = stream_file_offset
-            toc_entry.toc_data_size = len(dep_data)
-            toc_entry.entry_index = entry_index
-            toc_entries.append(toc_entry)
-            dep_data = pad_to_16_byte_align(dep_data)
+            toc_entries.append(TocHeader.record(dep.file_id, WWISE_DEP, toc_data_offset, stream_file_offset, len(dep_data), 0, entry_index))
             toc_data.append(dep_data)
             
-            toc_data_offset += len(dep_data)
+            toc_data_offset += align_16_byte(len(dep_data))
             entry_index += 1
 
         for video in self.video_sources.values():
-            data = video.get_data()
-            s_data = pad_to_16_byte_align(data)
-            t_data = bytes.fromhex("E9030000000000000000000000000000")
-            toc_entry = TocHeader()
-            toc_entry.file_id = video.file_id
-            toc_entry.type_id = BINK_VIDEO
-            toc_entry.toc_data_offset = toc_data_offset
-            toc_entry.stream_file_offset = stream_file_offset
-            toc_entry.toc_data_size = 0x10
-            toc_entry.stream_size = len(data)
-            toc_entry.entry_index = entry_index
-            stream_data.append(s_data)
-            toc_data.append(t_data)
-            toc_entries.append(toc_entry)
+            size = video.get_size()
+            toc_entries.append(TocHeader.record(video.file_id, BINK_VIDEO, toc_data_offset, stream_file_offset, 0x10, size, entry_index))
+            toc_data.append(bytes.fromhex("E9030000000000000000000000000000"))
+            stream_sources.append((video, size))
             entry_index += 1
-            stream_file_offset += len(s_data)
+            stream_file_offset += align_16_byte(size)
             toc_data_offset += 16
-            
-        toc_file.write(b"".join([entry.get_data() for entry in toc_entries]))
-        toc_file.advance(8)
-        toc_file.write(b"".join(toc_data))
-        stream_file.write(b"".join(stream_data))
-
-        with open(os.path.join(path, self.name), 'w+b') as f:
-            min_size = len(toc_entries) * 256
-            if len(toc_file.data) < min_size: toc_file.write(bytearray(min_size-len(toc_file.data)))
-            f.write(toc_file.data)
-            
-        if len(stream_file.data) > 0:
-            with open(os.path.join(path, self.name+".stream"), 'w+b') as f:
-                f.write(stream_file.data)
 
-    def load(self, toc_file: MemoryStream, stream_file: MemoryStream):
+        # second pass: write everything out. Both files are written to temporary files and only swapped in once
+        # both are complete, so a failure never leaves a new toc next to an old stream. The destination may also
+        # still be mapped by a loaded legacy archive, and truncating a mapped file in place invalidates the audio data sliced from it
+        toc_path = os.path.join(path, self.name)
+        temp_paths = [toc_path+".tmp"]
+        if stream_file_offset > 0:
+            temp_paths.append(toc_path+".stream.tmp")
+        try:
+            with open(toc_path+".tmp", 'w+b') as f:
+                f.write(struct.pack("<IIII56s", self.magic, self.num_types, self.num_files, self.unknown, self.unk4Data))
+                self.write_type_header(f, WWISE_STREAM, len(self.wwise_streams))
+                self.write_type_header(f, WWISE_BANK, len(self.wwise_banks))
+                self.write_type_header(f, WWISE_DEP, len(wwise_deps))
+                self.write_type_header(f, TEXT_BANK, len(self.text_banks))
+                self.write_type_header(f, BINK_VIDEO, len(self.video_sources))
+                f.write(numpy.array(toc_entries, dtype=TOC_ENTRY_DTYPE).tobytes())
+                f.write(bytes(8))
+                for data in toc_data:
+                    write_16_byte_aligned(f, data)
+                min_size = len(toc_entries) * 256
+                if toc_data_offset < min_size: f.write(bytes(min_size-toc_data_offset))
+            toc_data.clear()
+
+            if stream_file_offset > 0:
+                with open(toc_path+".stream.tmp", 'w+b') as f:
+                    for source, size in stream_sources:
+                        data = source.read_data()
+                        if len(data) != size:
+                            raise RuntimeError(
+                                f"Size of {source.get_id()} changed while writing {self.name}"
+                            )
+                        write_16_byte_aligned(f, data)
+                        del data
+
+            if slim.is_file_mapped(toc_path) or slim.is_file_mapped(toc_path+".stream"):
+                # writing over the package this was loaded from. Windows can't replace a file with a live mapping
+                self.copy_mapped_data()
+                gc.collect()
+            os.replace(toc_path+".tmp", toc_path)
+            if stream_file_offset > 0:
+                os.replace(toc_path+".stream.tmp", toc_path+".stream")
+        finally:
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def copy_mapped_data(self):
+        """
+        Replace the views into mapped package files held by this archive with
+        copies, so the files can be written over. Streams are read in full
+        """
+        def copy(data):
+            return bytes(data) if isinstance(data, memoryview) else data
+        streams = set()
+        audio_sources = [*self.audio_sources.values(), *(stream.audio_source for stream in self.wwise_streams.values())]
+        for audio in audio_sources:
+            if audio is None:
+                continue
+            if audio.lazy_data is not None:
+                streams.add(audio.lazy_data[0])
+            else:
+                audio._data = copy(audio._data)
+            audio.data_old = copy(audio.data_old)
+        for bank in self.wwise_banks.values():
+            bank.original_data = copy(bank.original_data)
+            bank.invalidate()
+            if bank.hierarchy is not None:
+                bank.hierarchy.hierarchy_data = copy(bank.hierarchy.hierarchy_data)
+        for stream in streams:
+            if stream.path:
+                stream.data = bytes(stream.data)
+                stream.path = ""
+
+    @staticmethod
+    def read_toc_table(toc_file: MemoryStream | MemoryViewStream, offset: int, num_files: int) -> numpy.ndarray:
+        """
+        Return the toc entries of an archive as a structured array over the toc
+        buffer. Rows have the layout of TocHeader.get_data
+        """
+        return numpy.frombuffer(toc_file.data, dtype=TOC_ENTRY_DTYPE, count=num_files, offset=offset)
+
+    def load(self, toc_file: MemoryStream | MemoryViewStream, stream_file: MemoryStream | PackageStream, lazy_hierarchy: bool = False):
+        """
+        With a MemoryViewStream, bank chunks and bank media are kept as views into
+        the toc buffer rather than copied out of it
+
+        With lazy_hierarchy, each bank only parses the hierarchy entries that
+        audio sources are attached to. The rest of a bank's hierarchy is parsed
+        when it is first used and is only added to hierarchy_entries by
+        materialize_hierarchies
+        """
         self.wwise_streams.clear()
         self.wwise_banks.clear()
         self.audio_sources.clear()
@@ -772,6 +1100,7 @@ class GameArchive:
         self.hierarchy_entries.clear()
         
         media_index = MediaIndex()
+        banks: list[tuple[WwiseBank, int, memoryview | bytearray | None]] = []
         
         self.magic      = toc_file.uint32_read()
         if self.magic != 0xF0000011: return False
@@ -779,63 +1108,38 @@ class GameArchive:
         self.num_types   = toc_file.uint32_read()
         self.num_files   = toc_file.uint32_read()
         self.unknown    = toc_file.uint32_read()
-        self.unk4Data   = toc_file.read(56)
+        self.unk4Data   = bytes(toc_file.read(56))
         toc_file.seek(toc_file.tell() + 32 * self.num_types)
-        toc_start = toc_file.tell()
-        for n in range(self.num_files):
-            toc_file.seek(toc_start + n*80)
-            toc_header = TocHeader()
-            toc_header.from_memory_stream(toc_file)
+        toc_table = self.read_toc_table(toc_file, toc_file.tell(), self.num_files)
+        for file_id, type_id, toc_data_offset, stream_file_offset, _, _, _, toc_data_size, stream_size, *_ in toc_table.tolist():
             entry = None
-            if toc_header.type_id == WWISE_STREAM:
+            if type_id == WWISE_STREAM:
                 audio = AudioSource()
                 audio.stream_type = STREAM
                 entry = WwiseStream()
-                entry.file_id = toc_header.file_id
-                toc_file.seek(toc_header.toc_data_offset)
-                stream_file.seek(toc_header.stream_file_offset)
-                audio.set_data(stream_file.read(toc_header.stream_size), notify_subscribers=False, set_modified=False)
-                audio.resource_id = toc_header.file_id
+                entry.file_id = file_id
+                toc_file.seek(toc_data_offset)
+                if isinstance(stream_file, PackageStream):
+                    audio.set_lazy_data(stream_file, stream_file_offset, stream_size)
+                else:
+                    stream_file.seek(stream_file_offset)
+                    audio.set_data(stream_file.read(stream_size), notify_subscribers=False, set_modified=False)
+                audio.resource_id = file_id
                 entry.set_source(audio)
                 self.wwise_streams[entry.get_id()] = entry
-            elif toc_header.type_id == WWISE_BANK:
+            elif type_id == WWISE_BANK:
                 entry = WwiseBank()
-                toc_file.seek(toc_header.toc_data_offset)
+                toc_file.seek(toc_data_offset)
                 toc_file.advance(16)
-                entry.file_id = toc_header.file_id
+                entry.file_id = file_id
                 bank = BankParser()
-                bank.load(toc_file.read(toc_header.toc_data_size-16))
+                # keep the bank bytes so an unmodified bank can be written back without regenerating it
+                entry.original_data = toc_file.read(toc_data_size-16)
+                bank.load(entry.original_data)
                 entry.bank_header = "BKHD".encode('utf-8') + len(bank.chunks["BKHD"]).to_bytes(4, byteorder="little") + bank.chunks["BKHD"]
                 bank_version = int.from_bytes(bank.chunks['BKHD'][0:4], "little") ^ BANK_VERSION_KEY
-                if bank_version == 154:
-                    hirc = WwiseHierarchy_154(soundbank=entry)
-                else:
-                    hirc = WwiseHierarchy_140(soundbank=entry)
-                try:
-                    hirc.load(bank.chunks['HIRC'])
-                except KeyError:
-                    pass
-                replacements = {}
-                for hirc_id, hirc_entry in hirc.entries.items():
-                    if hirc_id in self.hierarchy_entries:
-                        existing_entry = self.hierarchy_entries[hirc_id]
-                        # rearrange stuff
-                        if isinstance(hirc_entry, (wwise_hierarchy_140.ActorMixer, wwise_hierarchy_140.SwitchContainer, wwise_hierarchy_140.RandomSequenceContainer, wwise_hierarchy_140.LayerContainer, wwise_hierarchy_140.MusicSwitchContainer
-                                                   , wwise_hierarchy_154.ActorMixer, wwise_hierarchy_154.SwitchContainer, wwise_hierarchy_154.RandomSequenceContainer, wwise_hierarchy_154.LayerContainer, wwise_hierarchy_154.MusicSwitchContainer)):
-                            for child in hirc_entry.children.children:
-                                if child not in existing_entry.children.children:
-                                    existing_entry.children.children.append(child)
-                                    existing_entry.children.numChildren += 1
-                                    existing_entry.size += 4
-                        existing_entry.soundbanks.append(entry)
-                        replacements[hirc_id] = existing_entry
-                    else:
-                        self.hierarchy_entries[hirc_id] = hirc_entry
-                for hirc_id, hirc_entry in replacements.items():
-                    hirc._remove_categorized_entry(hirc.entries[hirc_id])
-                    hirc._categorized_entry(hirc_entry)
-                hirc.entries.update(replacements)
-                entry.hierarchy = hirc
+                # hierarchies are parsed once every bank is known, then merged in toc order
+                banks.append((entry, bank_version, bank.chunks.get('HIRC')))
                 #Add all bank sources to the source list
                 if "DIDX" in bank.chunks.keys():
                     new_media_index = MediaIndex()
@@ -853,34 +1157,40 @@ class GameArchive:
                 dep = WwiseDep()
                 dep.skip = True
                 dep.data = f"Bank {entry.get_id()}"
-                dep.file_id = toc_header.file_id
+                dep.file_id = file_id
                 entry.dep = dep
 
                 self.wwise_banks[entry.get_id()] = entry
-            elif toc_header.type_id == WWISE_DEP: #wwise dep
+            elif type_id == WWISE_DEP: #wwise dep
                 dep = WwiseDep()
-                dep.file_id = toc_header.file_id
-                toc_file.seek(toc_header.toc_data_offset)
+                dep.file_id = file_id
+                toc_file.seek(toc_data_offset)
                 dep.from_memory_stream(toc_file)
                 try:
-                    self.wwise_banks[toc_header.file_id].dep = dep
+                    self.wwise_banks[file_id].dep = dep
                 except KeyError:
                     pass
-            elif toc_header.type_id == TEXT_BANK: #string_entry
-                toc_file.seek(toc_header.toc_data_offset)
-                data = toc_file.read(toc_header.toc_data_size)
+            elif type_id == TEXT_BANK: #string_entry
+                toc_file.seek(toc_data_offset)
+                data = bytes(toc_file.read(toc_data_size))
                 text_bank = TextBank()
-                text_bank.file_id = toc_header.file_id
+                text_bank.file_id = file_id
+                text_bank.original_data = data
                 text_bank.set_data(data)
                 self.text_banks[text_bank.get_id()] = text_bank
-            elif toc_header.type_id == BINK_VIDEO:
+            elif type_id == BINK_VIDEO:
                 new_video_source = VideoSource()
-                new_video_source.file_id = toc_header.file_id
-                new_video_source.stream_offset = toc_header.stream_file_offset
-                new_video_source.video_size = toc_header.stream_size
+                new_video_source.file_id = file_id
+                new_video_source.stream_offset = stream_file_offset
+                new_video_source.video_size = stream_size
                 new_video_source.filepath = self.path
                 self.video_sources[new_video_source.file_id] = new_video_source
 
+        for entry, bank_version, hierarchy_data in banks:
+            hirc = parse_hierarchy(bank_version, hierarchy_data, entry, lazy_hierarchy)
+            self._merge_hierarchy(entry, hirc)
+            if not hirc.is_materialized():
+                hirc.materialize_listeners.append(self._merge_materialized_entries)
         
         # Create all AudioSource objects
 
@@ -889,6 +1199,57 @@ class GameArchive:
         # Construct list of audio sources in each bank
         self._book_keep_audio_sources_per_bank()
 
+        if stream_resource_ids_changed:
+            save_stream_resource_ids()
+
+    def materialize_hierarchies(self):
+        """
+        Parse what is left of lazily loaded hierarchies. Entries are merged into
+        hierarchy_entries whenever a hierarchy is materialized, whether by this
+        or by anything that used the hierarchy
+        """
+        for bank in self.wwise_banks.values():
+            if bank.hierarchy != None:
+                bank.hierarchy.materialize()
+
+    def _merge_materialized_entries(
+        self,
+        hirc: WwiseHierarchy_154 | WwiseHierarchy_140,
+        new_entries: list[wwise_hierarchy_140.HircEntry | wwise_hierarchy_154.HircEntry]
+    ):
+        hirc.materialize_listeners.remove(self._merge_materialized_entries)
+        self._merge_hierarchy(hirc.soundbank, hirc, {hirc_entry.get_id(): hirc_entry for hirc_entry in new_entries})
+
+    def _merge_hierarchy(
+        self,
+        entry: 'WwiseBank',
+        hirc: WwiseHierarchy_154 | WwiseHierarchy_140,
+        hirc_entries: dict[int, wwise_hierarchy_140.HircEntry | wwise_hierarchy_154.HircEntry] | None = None
+    ):
+        if hirc_entries == None:
+            hirc_entries = hirc.entries
+        replacements = {}
+        for hirc_id, hirc_entry in hirc_entries.items():
+            if hirc_id in self.hierarchy_entries:
+                existing_entry = self.hierarchy_entries[hirc_id]
+                # rearrange stuff
+                if isinstance(hirc_entry, (wwise_hierarchy_140.ActorMixer, wwise_hierarchy_140.SwitchContainer, wwise_hierarchy_140.RandomSequenceContainer, wwise_hierarchy_140.LayerContainer, wwise_hierarchy_140.MusicSwitchContainer
+                                           , wwise_hierarchy_154.ActorMixer, wwise_hierarchy_154.SwitchContainer, wwise_hierarchy_154.RandomSequenceContainer, wwise_hierarchy_154.LayerContainer, wwise_hierarchy_154.MusicSwitchContainer)):
+                    for child in hirc_entry.children.children:
+                        if child not in existing_entry.children.children:
+                            existing_entry.children.children.append(child)
+                            existing_entry.children.numChildren += 1
+                            existing_entry.size += 4
+                existing_entry.soundbanks.append(entry)
+                replacements[hirc_id] = existing_entry
+            else:
+                self.hierarchy_entries[hirc_id] = hirc_entry
+        for hirc_id, hirc_entry in replacements.items():
+            hirc._remove_categorized_entry(hirc.entries[hirc_id])
+            hirc._categorized_entry(hirc_entry)
+        hirc.entries.update(replacements)
+        entry.hierarchy = hirc
+
     def _create_all_audio_source_objects(self, media_index: MediaIndex):
        for bank in self.wwise_banks.values():
            self._create_all_audio_source_objects_from_bank(bank, media_index)
@@ -905,6 +1266,12 @@ class GameArchive:
         dep = bank.dep
 
         entries_with_audio_sources = hirc.get_sounds() + hirc.get_music_tracks()
+        add_stream_resource_ids(os.path.dirname(dep.data), (
+            source_struct.source_id
+            for entry_with_audio_source in entries_with_audio_sources
+            for source_struct in entry_with_audio_source.sources
+            if source_struct.stream_type in (STREAM, PREFETCH_STREAM)
+        ))
         for entry_with_audio_source in entries_with_audio_sources:
             for source_struct in entry_with_audio_source.sources:
                 audio_source = self._create_audio_source(
@@ -1027,9 +1394,7 @@ class GameArchive:
         source: wwise_hierarchy_140.BankSourceStruct | wwise_hierarchy_154.BankSourceStruct,
         dep: WwiseDep
     ) -> AudioSource | None:
-        stream_resource_id = murmur64_hash(
-            (os.path.dirname(dep.data) + "/" + str(source.source_id)).encode('utf-8')
-        )
+        stream_resource_id = get_stream_resource_id(os.path.dirname(dep.data), source.source_id)
         if stream_resource_id not in self.wwise_streams:
             logger.warning(
                 "There is no WwiseStream associated with stream resource ID"
@@ -1053,7 +1418,6 @@ class GameArchive:
                     f"WwiseBank {bank.file_id} has no WwiseHierarchy"
                 )
 
-            bank_audio_sources = bank.get_content()
             music_tracks = bank.hierarchy.get_music_tracks()
             for music_track in music_tracks:
                 for info in music_track.track_info:
@@ -1081,8 +1445,7 @@ class GameArchive:
                         )
                         continue
                     self.audio_sources[source_id].parents.add(music_track)
-                    if source_id not in bank_audio_sources:
-                        bank.add_content(source_id)
+                    bank.add_content(source_id)
 
             sounds = bank.hierarchy.get_sounds()
             for sound in sounds:
@@ -1106,8 +1469,7 @@ class GameArchive:
                     continue
                 audio_source = self.audio_sources[source_id]
                 audio_source.parents.add(sound)
-                if audio_source.get_short_id() not in bank_audio_sources:
-                    bank.add_content(audio_source.get_short_id())
+                bank.add_content(audio_source.get_short_id())
 
         
 class SoundHandler:
@@ -1449,13 +1811,13 @@ class Mod:
         sound.raise_modified()
 
         # Update WwiseBank audio source list
-        bank = sound.soundbank
-        if not isinstance(bank, WwiseBank): 
-            raise AssertionError(
-                f"Sound object {sound.hierarchy_id} sound bank field is not "
-                 "an instance of sound bank."
-            )
-        bank.content.append(audio_source)
+        for bank in sound.soundbanks:
+            if not isinstance(bank, WwiseBank): 
+                raise AssertionError(
+                    f"Sound object {sound.hierarchy_id} sound bank field is not "
+                     "an instance of sound bank."
+                )
+            bank.add_content(short_id)
 
         # Update Mod audio source list
         self.audio_sources[short_id] = audio_source
@@ -1760,11 +2122,11 @@ class Mod:
     def get_text_banks(self) -> dict[int, TextBank]:
         return self.text_banks
         
-    def load_archive_file(self, archive_file: str = ""):
+    def load_archive_file(self, archive_file: str = "", lazy_hierarchy: bool = False):
 
         if os.path.splitext(archive_file)[1] in (".stream", ".gpu_resources"):
             archive_file = os.path.splitext(archive_file)[0]
-        new_archive = GameArchive.from_file(archive_file)
+        new_archive = GameArchive.from_file(archive_file, lazy_hierarchy)
         
         if not new_archive:
             return False
@@ -1776,6 +2138,49 @@ class Mod:
         self.add_game_archive(new_archive)
 
         return True
+
+    def load_archive_files(self, archive_files: list[str], workers: int = 0, lazy_hierarchy: bool = False) -> list[bool]:
+        """
+        Load several archives at once. With more than one worker (archive_load_workers
+        if 0) the archives are read and parsed in worker processes, then added to the
+        mod one at a time in the order given, so the result is the same as calling
+        load_archive_file for each of them.
+
+        Returns whether each archive was added, in the order given
+        """
+        archive_files = [
+            os.path.splitext(f)[0] if os.path.splitext(f)[1] in (".stream", ".gpu_resources") else f
+            for f in archive_files
+        ]
+        workers = min(workers or archive_load_workers, len(archive_files))
+        if workers <= 1:
+            return [self.load_archive_file(f, lazy_hierarchy) for f in archive_files]
+
+        # archives that are already loaded, or listed twice, are only added once anyway
+        to_load = list(dict.fromkeys(
+            f for f in archive_files if os.path.basename(f) not in self.game_archives
+        ))
+        archives = {}
+        if to_load:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(to_load)),
+                initializer=init_archive_load_worker,
+                initargs=(slim.game_data_folder, slim.index_cache_path)
+            ) as pool:
+                archives = dict(zip(to_load, pool.map(load_game_archive, to_load, [lazy_hierarchy] * len(to_load))))
+
+        results = []
+        for archive_file in archive_files:
+            new_archive = archives.pop(archive_file, None)
+            if not new_archive or new_archive.name in self.game_archives:
+                results.append(False)
+                continue
+            add_archive_stream_resource_ids(new_archive)
+            self.add_game_archive(new_archive)
+            results.append(True)
+        if stream_resource_ids_changed:
+            save_stream_resource_ids()
+        return results
         
     def import_wwise_hierarchy(self, soundbank_id: int, new_hierarchy: WwiseHierarchy_154):
         # check if 9ba626afa44a3aa3 is loaded (maybe music_init, too?)
@@ -1793,6 +2198,61 @@ class Mod:
             new_id = random.randint(0, 0xffffffff)
         return new_id
         
+    def _add_hierarchy_entries(
+        self,
+        game_archive: GameArchive,
+        hierarchy_entries: dict[int, wwise_hierarchy_140.HircEntry | wwise_hierarchy_154.HircEntry]
+    ):
+        replacements = {}
+        for key, entry in hierarchy_entries.items():
+            if key in self.get_hierarchy_entries():
+                self.hierarchy_count[key] += 1
+                existing_entry = self.get_hierarchy_entry(key)
+                replacements[key] = existing_entry
+                if isinstance(entry, (wwise_hierarchy_154.ActorMixer, wwise_hierarchy_140.ActorMixer)):
+                    for child in entry.children.children:
+                        if child not in existing_entry.children.children:
+                            existing_entry.children.children.append(child)
+                            existing_entry.children.numChildren += 1
+                            existing_entry.size += 4
+                for bank in entry.soundbanks:
+                    bank.hierarchy.entries[key] = existing_entry
+                    if existing_entry.modified:
+                        bank.raise_modified()
+                    if bank not in existing_entry.soundbanks:
+                        existing_entry.soundbanks.append(bank)
+            else:
+                self.hierarchy_count[key] = 1
+                self.hierarchy_entries[key] = entry
+        # update in each soundbank hierarchy's type lists, each soundbank hierarchy, and then GameArchive
+        for bank in game_archive.wwise_banks.values():
+            hirc = bank.hierarchy
+            for hirc_id, hirc_entry in replacements.items():
+                if hirc_id in hirc.entries.keys():
+                    try:
+                        hirc._remove_categorized_entry(hirc.entries[hirc_id])
+                    except:
+                        pass
+                    hirc._categorized_entry(hirc_entry)
+                    hirc.entries[hirc_id] = hirc_entry
+        game_archive.get_hierarchy_entries().update(replacements)
+
+    def _add_materialized_entries(
+        self,
+        hirc: WwiseHierarchy_154 | WwiseHierarchy_140,
+        new_entries: list[wwise_hierarchy_140.HircEntry | wwise_hierarchy_154.HircEntry]
+    ):
+        hirc.materialize_listeners.remove(self._add_materialized_entries)
+        for game_archive in self.game_archives.values():
+            if game_archive.wwise_banks.get(hirc.soundbank.get_id()) is hirc.soundbank:
+                # the archive has already merged the new entries. Those it replaced with one of its own
+                # entries, which the mod has counted, now share the mod's entry
+                self._add_hierarchy_entries(game_archive, {
+                    hirc_entry.get_id(): hirc_entry for hirc_entry in new_entries
+                    if game_archive.hierarchy_entries.get(hirc_entry.get_id()) is hirc_entry
+                })
+                return
+
     def remove_game_archive(self, archive_name: str = ""):
         if archive_name not in self.game_archives.keys():
             raise AssertionError(f"Archive {archive_name} not in mod!")
@@ -1820,6 +2280,9 @@ class Mod:
                         for parent in parents:
                             if isinstance(parent, (wwise_hierarchy_154.HircEntry, wwise_hierarchy_140.HircEntry)) and key in [b.get_id() for b in parent.soundbanks]:
                                 audio.parents.remove(parent)
+                    hirc = self.get_wwise_banks()[key].hierarchy
+                    if self._add_materialized_entries in hirc.materialize_listeners:
+                        hirc.materialize_listeners.remove(self._add_materialized_entries)
                     del self.get_wwise_banks()[key]
                     del self.bank_count[key]
         for key, entry in game_archive.get_hierarchy_entries().items():
@@ -1854,6 +2317,10 @@ class Mod:
                 if self.audio_count[key] == 0:
                     del self.get_audio_sources()[key]
                     del self.audio_count[key]
+
+        # shared hierarchy entries and audio sources may have changed
+        for bank in self.get_wwise_banks().values():
+            bank.invalidate()
         
         try:
             del self.game_archives[archive_name]
@@ -1898,39 +2365,12 @@ class Mod:
                 self.video_sources[key] = entry
                 self.video_count[key] = 1
         
-        replacements = {}
-        for key, entry in game_archive.get_hierarchy_entries().items():
-            if key in self.get_hierarchy_entries():
-                self.hierarchy_count[key] += 1
-                existing_entry = self.get_hierarchy_entry(key)
-                replacements[key] = existing_entry
-                if isinstance(entry, (wwise_hierarchy_154.ActorMixer, wwise_hierarchy_140.ActorMixer)):
-                    for child in entry.children.children:
-                        if child not in existing_entry.children.children:
-                            existing_entry.children.children.append(child)
-                            existing_entry.children.numChildren += 1
-                            existing_entry.size += 4
-                for bank in entry.soundbanks:
-                    bank.hierarchy.entries[key] = existing_entry
-                    if existing_entry.modified:
-                        bank.raise_modified()
-                    if bank not in existing_entry.soundbanks:
-                        existing_entry.soundbanks.append(bank)
-            else:
-                self.hierarchy_count[key] = 1
-                self.hierarchy_entries[key] = entry
-        # update in each soundbank hierarchy's type lists, each soundbank hierarchy, and then GameArchive
-        for bank in game_archive.wwise_banks.values():
-            hirc = bank.hierarchy
-            for hirc_id, hirc_entry in replacements.items():
-                if hirc_id in hirc.entries.keys():
-                    try:
-                        hirc._remove_categorized_entry(hirc.entries[hirc_id])
-                    except:
-                        pass
-                    hirc._categorized_entry(hirc_entry)
-                    hirc.entries[hirc_id] = hirc_entry
-        game_archive.get_hierarchy_entries().update(replacements)
+        # a lazily loaded bank the mod already has is replaced by the mod's one below and would
+        # never be parsed, so its entries are parsed and counted now
+        for key, bank in game_archive.wwise_banks.items():
+            if key in self.get_wwise_banks() and bank.hierarchy != None:
+                bank.hierarchy.materialize()
+        self._add_hierarchy_entries(game_archive, game_archive.get_hierarchy_entries())
         
         for key in game_archive.wwise_banks.keys():
             if key in self.get_wwise_banks().keys():
@@ -1955,6 +2395,10 @@ class Mod:
             else:
                 self.bank_count[key] = 1
                 self.get_wwise_banks()[key] = game_archive.wwise_banks[key]
+                # entries of a lazily loaded hierarchy are added once they are parsed
+                hirc = game_archive.wwise_banks[key].hierarchy
+                if hirc != None and not hirc.is_materialized():
+                    hirc.materialize_listeners.append(self._add_materialized_entries)
         for key in game_archive.wwise_streams.keys():
             if key in self.get_wwise_streams().keys():
                 self.stream_count[key] += 1
@@ -1990,6 +2434,10 @@ class Mod:
             else:
                 self.audio_count[key] = 1
                 self.get_audio_sources()[key] = game_archive.audio_sources[key]
+
+        # shared hierarchy entries and audio sources may have changed
+        for bank in self.get_wwise_banks().values():
+            bank.invalidate()
             
     def import_patch(self, patch_file: str = "", import_hierarchy=True):
         """
@@ -2020,7 +2468,8 @@ class Mod:
                 continue
             if (not old_audio.modified and new_audio.get_data() != old_audio.get_data()
                 or old_audio.modified and new_audio.get_data() != old_audio.data_old):
-                old_audio.set_data(new_audio.get_data())
+                # copy, so that the mod does not keep the patch file mapped
+                old_audio.set_data(bytearray(new_audio.get_data()))
                 sample_rate = int.from_bytes(new_audio.get_data()[24:28], byteorder="little")
                 num_samples = int.from_bytes(new_audio.get_data()[44:48], byteorder="little")
                 len_ms = num_samples * 1000 / sample_rate
@@ -20,6 +20,11 @@ DIR = os.path.abspath(DIR)
 CACHE = os.path.abspath(CACHE)
 TMP = os.path.abspath(TMP)
 
+# indexes of the game data folder and stream resource ids are kept between sessions, unlike CACHE
+BUNDLE_INDEX_CACHE = os.path.join(DIR, "bundle_index.cache")
+TOC_INDEX_CACHE = os.path.join(DIR, "toc_index.cache")
+STREAM_ID_CACHE = os.path.join(DIR, "stream_resource_ids.cache")
+
 DEFAULT_WWISE_PROJECT = posixpath.join(
     DIR, "AudioConversionTemplate/AudioConversionTemplate.wproj")
 
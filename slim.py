@@ -1,8 +1,15 @@
 import struct
 import os
+import mmap
+import numpy
 #import lz4.block
 from lz4 import block
 import sys
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 def read_int(file):
     return int.from_bytes(file.read(4), "little")
@@ -35,156 +42,637 @@ BUNDLED = 2
 DSAR = 1
 UNKNOWN = 0
 
+# bundle index cache
+INDEX_MAGIC = b"SLIX"
+INDEX_VERSION = 3
+
+# toc index cache
+TOC_INDEX_MAGIC = b"SLTI"
+TOC_INDEX_VERSION = 1
+
+TOC_MAGIC = 0xF0000011
+
+CHUNK_HEADER_DTYPE = numpy.dtype([
+    ("uncompressed_offset", "<u8"),
+    ("compressed_offset", "<u8"),
+    ("uncompressed_size", "<u4"),
+    ("compressed_size", "<u4"),
+    ("compression_type", "u1"),
+    ("chunk_type", "u1"),
+    ("padding", "V6"),
+])
+
+# package records and bundle items of the bundles.nxa package table
+PACKAGE_RECORD_DTYPE = numpy.dtype([
+    ("size", "<u8"),
+    ("name_offset", "<u4"),
+    ("items_count", "<u4"),
+    ("items_offset", "<u4"),
+    ("padding", "V4"),
+])
+
+BUNDLE_ITEM_DTYPE = numpy.dtype([
+    ("original_archive_offset", "<u8"),
+    ("start_offset", "<u4"),
+    ("padding", "V3"),
+    ("bundle_index", "u1"),
+])
+
+TOC_ENTRY_DTYPE = numpy.dtype([
+    ("file_id", "<u8"),
+    ("type_id", "<u8"),
+    ("toc_data_offset", "<u8"),
+    ("stream_file_offset", "<u8"),
+    ("gpu_resource_offset", "<u8"),
+    ("unknown1", "<u8"),
+    ("unknown2", "<u8"),
+    ("toc_data_size", "<u4"),
+    ("stream_size", "<u4"),
+    ("gpu_resource_size", "<u4"),
+    ("unknown3", "<u4"),
+    ("unknown4", "<u4"),
+    ("entry_index", "<u4"),
+])
+
+TOC_INDEX_DTYPE = numpy.dtype([
+    ("file_id", "<u8"),
+    ("type_id", "<u8"),
+    ("toc_data_offset", "<u8"),
+    ("stream_file_offset", "<u8"),
+    ("toc_data_size", "<u4"),
+    ("stream_size", "<u4"),
+    ("package", "<u4"),
+])
+
 done_init = False
 package_contents = {}
-bundle_offsets = {}
+bundle_chunks = {}
+bundle_readers = {}
+bundle_readers_lock = threading.Lock()
+
+# lz4 releases the GIL, so large reads decompress their chunks on a thread pool
+# set to 1 to decompress everything on the calling thread
+decompression_workers = min(8, os.cpu_count() or 1)
+decompression_pool = None
+
+# byte budget of the decompressed chunk cache shared by every bundle reader; 0 disables caching
+# the default holds the chunks of a few of the largest packages, which covers loading an archive and
+# its stream file together, and is small next to the archives the app keeps in memory
+# set it with set_chunk_cache_budget, the chunk_cache_budget setting of the app, or -m on the command line
+chunk_cache_budget = 256 * 1024 * 1024
+
+# packages are scanned for the toc index in worker processes, in batches of toc_scan_batch_size
+toc_scan_workers = os.cpu_count() or 1
+toc_scan_batch_size = 64
+toc_index = None
+toc_index_lock = threading.Lock()
+
+# package type resolution; the data folder is listed at most once per session
+data_folder_files = None
+package_types = {}
+slim_version = None
 
 game_data_folder = ""
+index_cache_path = "bundle_index.cache"
+toc_index_path = "toc_index.cache"
+
+# normalized path of every open mapping, to tell whether a file about to be written over is still mapped
+mapped_files = weakref.WeakKeyDictionary()
+
+def slim_init(file_path: str, cache_path: str = "", save_index: bool = True):
+
+    # worker processes pass save_index=False: they load the index the main process saved,
+    # and if they have to build it themselves they keep it to themselves
 
-def slim_init(file_path: str):
     global game_data_folder
+    global index_cache_path
     game_data_folder = file_path
+    if cache_path:
+        index_cache_path = cache_path
+    global toc_index
+    global data_folder_files
+    global package_types
+    global slim_version
+    toc_index = None
+    data_folder_files = None
+    package_types = {}
+    slim_version = None
+    close_bundle_readers()
+    chunk_cache.clear()
     if is_slim_version():
-        init_bundle_mapping()
+        init_bundle_mapping(save_index)
 
 def is_slim_version():
-    return not os.path.exists(os.path.join(game_data_folder, "9ba626afa44a3aa3"))
+    global slim_version
+    if slim_version is None:
+        slim_version = not os.path.exists(os.path.join(game_data_folder, "9ba626afa44a3aa3"))
+    return slim_version
 
-def decompress_dsar(file_path):
+def get_data_folder_files() -> set[str]:
 
-    # decompresses entire bundle file
+    # names of the files in the data folder when it was first listed this session
 
-    bundle = open(file_path, 'rb')
+    global data_folder_files
+    if data_folder_files is None:
+        try:
+            data_folder_files = {entry.name for entry in os.scandir(game_data_folder) if entry.is_file()}
+        except OSError:
+            data_folder_files = set()
+    return data_folder_files
 
-    bundle.seek(8)
-    num_chunks = read_int(bundle) # num data chunks
-    data = []
-    file_count = 0
-
-    for i in range(num_chunks):
-        bundle.seek(0x20 + i * 0x20)
-        uncompressed_offset = read_long(bundle)
-        compressed_offset =   read_long(bundle)
-        uncompressed_size =   read_int(bundle)
-        compressed_size =     read_int(bundle)
-        compression_type =    read_char(bundle)
-        chunk_type =          read_char(bundle)
-
-        bundle.seek(compressed_offset)
-
-        # read and decompress data
-        temp_data = bundle.read(compressed_size)
-        if compression_type == COMPRESSED:
-            temp_data = block.decompress(temp_data, uncompressed_size=uncompressed_size)
-        data.append(temp_data)
+def get_data_folder_name(file_path: str) -> str:
 
-    bundle.close()
+    # returns the file name if the path is in the data folder, otherwise ""
 
-    return b"".join(data)
+    folder, name = os.path.split(file_path)
+    if not folder or os.path.normcase(os.path.abspath(folder)) == os.path.normcase(os.path.abspath(game_data_folder)):
+        return name
+    return ""
 
-def get_resource_from_bundle(bundle_path: str, resource_file_offset: int):
+def package_file_exists(file_path: str) -> bool:
 
-    # returns resource from bundle file; resource determined by file offset in uncompressed bundle
-    # handles resources split into multiple compressed chunks to return complete resource
+    # files listed in the data folder are not checked again; anything else, like patches written since, still is
+
+    name = get_data_folder_name(file_path)
+    if name and name in get_data_folder_files():
+        return True
+    return os.path.exists(file_path)
+
+def get_package_type(package_path: str) -> int:
+
+    # classifies the package as BUNDLED, DSAR or LEGACY
+    # packages in the data folder are classified once per session; packages elsewhere are sniffed on every call
+
+    name = get_data_folder_name(package_path)
+    if name:
+        try:
+            return package_types[name]
+        except KeyError:
+            pass
+        if name not in get_data_folder_files() and name in package_contents:
+            package_types[name] = BUNDLED
+            return BUNDLED
 
-    bundle = open(bundle_path, 'rb')
+    if os.path.exists(package_path):
+        with open(package_path, 'rb') as f:
+            magic = int.from_bytes(f.read(4), "little")
+            if magic == 1380012868: # compressed DSAR file
+                package_type = DSAR
+            else:
+                package_type = LEGACY
+    else:
+        # not cached: the package may still be written later in the session
+        return BUNDLED
+
+    if name:
+        package_types[name] = package_type
+    return package_type
+
+def read_chunk_headers(bundle) -> numpy.ndarray:
     bundle.seek(8)
     num_chunks = read_int(bundle) # num data chunks
-    data = []
-    
-    global bundle_offsets
-    chunk_num = bundle_offsets[os.path.basename(bundle_path)][resource_file_offset]
+    bundle.seek(0x20)
+    return numpy.frombuffer(bundle.read(0x20*num_chunks), dtype=CHUNK_HEADER_DTYPE)
 
-    while True:
-        bundle.seek(0x20 + 0x20 * chunk_num)
-        uncompressed_offset, compressed_offset, uncompressed_size, compressed_size, compression_type, chunk_type = struct.unpack("<QQIIBB6x", bundle.read(0x20))
+class ChunkCache:
 
-        if chunk_type & START and len(data) > 0:
-            bundle.close()
-            return b"".join(data)
+    # least recently used decompressed chunks, keyed by (bundle, chunk index)
+    # shared by every reader in the process and bounded by chunk_cache_budget bytes
 
-        # read and decompress data
-        bundle.seek(compressed_offset)
-        temp_data = bundle.read(compressed_size)
+    def __init__(self):
+        self.chunks = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple[str, int]) -> bytes | None:
+        with self.lock:
+            try:
+                data = self.chunks[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.chunks.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: tuple[str, int], data: bytes):
+        with self.lock:
+            if len(data) > chunk_cache_budget or key in self.chunks:
+                return
+            self.chunks[key] = data
+            self.size += len(data)
+            self.evict(chunk_cache_budget)
+
+    def evict(self, budget: int):
+        while self.size > budget:
+            _, data = self.chunks.popitem(last=False)
+            self.size -= len(data)
+
+    def clear(self):
+        with self.lock:
+            self.chunks.clear()
+            self.size = 0
+            self.hits = self.misses = 0
+
+chunk_cache = ChunkCache()
+
+def set_chunk_cache_budget(budget: int):
+    global chunk_cache_budget
+    chunk_cache_budget = budget
+    with chunk_cache.lock:
+        chunk_cache.evict(budget)
+
+class BundleReader:
+
+    # random access to the uncompressed contents of a DSAR bundle
+    # keeps the bundle open and only decompresses the chunks covering a requested range
+
+    def __init__(self, bundle_path: str, chunks: numpy.ndarray | None = None):
+        self.path = bundle_path
+        self.key = os.path.normcase(os.path.abspath(bundle_path))
+        self.file = open(bundle_path, 'rb')
+        self.lock = threading.Lock()
+        if chunks is None:
+            chunks = read_chunk_headers(self.file)
+        self.chunks = chunks
+        self.chunk_offsets = chunks["uncompressed_offset"]
+        if len(chunks) > 0:
+            self.size = int(chunks["uncompressed_offset"][-1]) + int(chunks["uncompressed_size"][-1])
+        else:
+            self.size = 0
+
+    def close(self):
+        self.file.close()
+
+    def find_chunk(self, offset: int) -> int:
+        # index of the chunk containing the uncompressed offset
+        return int(numpy.searchsorted(self.chunk_offsets, offset, side="right")) - 1
+
+    def chunk_range(self, offset: int, size: int) -> tuple[int, int]:
+        # [first, last) chunk indices covering the uncompressed range
+        if size <= 0:
+            return 0, 0
+        first = max(self.find_chunk(offset), 0)
+        last = self.find_chunk(offset + size - 1) + 1
+        return first, last
+
+    def read_compressed_chunk(self, chunk_index: int) -> bytes:
+        _, compressed_offset, _, compressed_size, _, _, _ = self.chunks[chunk_index].item()
+        with self.lock:
+            self.file.seek(compressed_offset)
+            return self.file.read(compressed_size)
+
+    def decompress_chunk(self, chunk_index: int, data: bytes, cache: bool = True) -> bytes:
+        _, _, uncompressed_size, _, compression_type, _, _ = self.chunks[chunk_index].item()
         if compression_type == COMPRESSED:
-            temp_data = block.decompress(temp_data, uncompressed_size=uncompressed_size)
-        data.append(temp_data)
+            data = block.decompress(data, uncompressed_size=uncompressed_size)
+            if cache:
+                chunk_cache.put((self.key, chunk_index), data)
+        return data
+
+    def get_cached_chunk(self, chunk_index: int) -> bytes | None:
+        # only compressed chunks are cached; stored chunks are as cheap to read again
+        if chunk_cache_budget <= 0 or self.chunks["compression_type"][chunk_index] != COMPRESSED:
+            return None
+        return chunk_cache.get((self.key, chunk_index))
+
+    def read_chunk(self, chunk_index: int) -> bytes:
+        data = self.get_cached_chunk(chunk_index)
+        if data is None:
+            data = self.decompress_chunk(chunk_index, self.read_compressed_chunk(chunk_index))
+        return data
+
+    def read_into(self, buffer: memoryview, offset: int, size: int, pool: ThreadPoolExecutor | None = None) -> list:
+
+        # writes size bytes starting at offset of the uncompressed bundle into buffer
+        # with a pool, the compressed chunks are read here and decompressed on the pool; the pending futures are returned
+
+        first, last = self.chunk_range(offset, size)
+        futures = []
+        for i in range(first, last):
+            chunk_offset = int(self.chunk_offsets[i])
+            start = max(offset - chunk_offset, 0)
+            end = min(offset + size - chunk_offset, int(self.chunks["uncompressed_size"][i]))
+            target = buffer[chunk_offset+start-offset:chunk_offset+end-offset]
+            cached = self.get_cached_chunk(i)
+            if cached is not None:
+                target[:] = memoryview(cached)[start:end]
+            elif pool is None:
+                target[:] = self.decompress_chunk(i, self.read_compressed_chunk(i))[start:end]
+            else:
+                futures.append(pool.submit(self._decompress_into, i, self.read_compressed_chunk(i), target, start, end))
+        return futures
+
+    def _decompress_into(self, chunk_index: int, data: bytes, target: memoryview, start: int, end: int):
+        data = self.decompress_chunk(chunk_index, data)
+        if start == 0 and end == len(data):
+            target[:] = data
+        else:
+            target[:] = memoryview(data)[start:end]
+
+    def write_to(self, file, file_offset: int, offset: int, size: int):
+
+        # writes size bytes starting at offset of the uncompressed bundle to file at file_offset
+        # only one decompressed chunk is held at a time, and chunks read this way are not added to the chunk cache
+
+        first, last = self.chunk_range(offset, size)
+        for i in range(first, last):
+            chunk_offset = int(self.chunk_offsets[i])
+            start = max(offset - chunk_offset, 0)
+            end = min(offset + size - chunk_offset, int(self.chunks["uncompressed_size"][i]))
+            data = self.get_cached_chunk(i)
+            if data is None:
+                data = self.decompress_chunk(i, self.read_compressed_chunk(i), cache=False)
+            file.seek(file_offset + chunk_offset + start - offset)
+            file.write(memoryview(data)[start:end])
+
+    def read(self, offset: int, size: int) -> bytes:
+
+        # returns size bytes starting at offset of the uncompressed bundle
+
+        first, last = self.chunk_range(offset, size)
+        data = [self.read_chunk(i) for i in range(first, last)]
+        if not data:
+            return b""
+        start = offset - int(self.chunk_offsets[first])
+        if len(data) == 1:
+            return data[0][start:start+size]
+        data[0] = data[0][start:]
+        return b"".join(data)[:size]
+
+    def read_resource(self, offset: int) -> bytes:
+
+        # returns the resource starting at offset; resources end where the next resource chunk starts
+        # handles resources split into multiple compressed chunks to return complete resource
+
+        chunk_num = self.find_chunk(offset)
+        chunk_types = self.chunks["chunk_type"]
+        end = chunk_num + 1
+        while end < len(self.chunks) and not chunk_types[end] & START:
+            end += 1
+        return b"".join([self.read_chunk(i) for i in range(chunk_num, end)])
+
+def get_bundle_reader(bundle_path: str) -> BundleReader:
+
+    # returns an open reader for the bundle, shared by every caller for the rest of the session
+
+    key = os.path.normcase(os.path.abspath(bundle_path))
+    try:
+        return bundle_readers[key]
+    except KeyError:
+        pass
+    with bundle_readers_lock:
+        if key not in bundle_readers:
+            # the indexed chunk headers only describe the bundles in the data folder
+            name = get_data_folder_name(bundle_path)
+            bundle_readers[key] = BundleReader(bundle_path, bundle_chunks.get(name) if name else None)
+        return bundle_readers[key]
+
+def close_bundle_readers():
+    for reader in bundle_readers.values():
+        reader.close()
+    bundle_readers.clear()
+
+def get_decompression_pool() -> ThreadPoolExecutor | None:
+
+    # returns the shared decompression pool, or None if decompression is single threaded
+
+    global decompression_pool
+    if decompression_workers <= 1:
+        return None
+    if decompression_pool is None:
+        decompression_pool = ThreadPoolExecutor(max_workers=decompression_workers, thread_name_prefix="slim")
+    return decompression_pool
+
+def wait_for(futures: list):
+    for future in futures:
+        future.result()
 
-        if chunk_num == num_chunks - 1:
-            bundle.close()
-            return b"".join(data)
-            
-        chunk_num += 1
+def decompress_dsar(file_path):
+
+    # decompresses entire bundle file
 
-    bundle.close()
+    reader = get_bundle_reader(file_path)
+    data = bytearray(reader.size)
+    wait_for(reader.read_into(memoryview(data), 0, reader.size, get_decompression_pool()))
+    return data
+
+def get_resource_from_bundle(bundle_path: str, resource_file_offset: int):
+
+    # returns resource from bundle file; resource determined by file offset in uncompressed bundle
+    # handles resources split into multiple compressed chunks to return complete resource
+
+    return get_bundle_reader(bundle_path).read_resource(resource_file_offset)
 
 class Package:
 
+    # bundle entries are stored as parallel arrays, one element per entry in package order:
+    # offset of the entry in the package, offset of the entry in the uncompressed bundle, and the bundle number
+
     def __init__(self):
         self.size = 0
         self.name = ""
-        self.entries = []
-
-class BundleEntry:
-
-    def __init__(self):
-        self.start_offset = self.bundle_index = self.original_archive_offset = 0
+        self.original_archive_offsets = numpy.empty(0, dtype="<u8")
+        self.start_offsets = numpy.empty(0, dtype="<u4")
+        self.bundle_indices = numpy.empty(0, dtype="u1")
+
+    def __len__(self):
+        return len(self.original_archive_offsets)
+
+    def add_entries(self, original_archive_offsets: numpy.ndarray, start_offsets: numpy.ndarray, bundle_indices: numpy.ndarray):
+        if len(self) == 0:
+            self.original_archive_offsets = original_archive_offsets
+            self.start_offsets = start_offsets
+            self.bundle_indices = bundle_indices
+        else:
+            self.original_archive_offsets = numpy.concatenate((self.original_archive_offsets, original_archive_offsets))
+            self.start_offsets = numpy.concatenate((self.start_offsets, start_offsets))
+            self.bundle_indices = numpy.concatenate((self.bundle_indices, bundle_indices))
+
+    def get_entries(self, first: int = 0, last: int | None = None) -> list[tuple[int, int, int, int]]:
+
+        # returns (original archive offset, size, bundle offset, bundle index) of entries [first, last)
+        # an entry runs until the next one starts, the last one until the end of the package
+
+        if last is None:
+            last = len(self)
+        ends = self.original_archive_offsets[first+1:last+1].tolist()
+        if len(ends) < last - first:
+            ends.append(self.size)
+        offsets = self.original_archive_offsets[first:last].tolist()
+        return list(zip(
+            offsets,
+            [end - offset for offset, end in zip(offsets, ends)],
+            self.start_offsets[first:last].tolist(),
+            self.bundle_indices[first:last].tolist()
+        ))
+
+def list_bundle_files():
+
+    # returns (name, size, mtime) of every bundle file in the data folder; used to validate the index cache
+
+    bundle_files = []
+    for entry in os.scandir(game_data_folder):
+        if (not entry.is_dir()) and (".patch" not in entry.name) and (os.path.splitext(entry.name)[1] in ["", ".stream", ".nxa", ".gpu_resources"]):
+            stat = entry.stat()
+            bundle_files.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    bundle_files.sort()
+    return bundle_files
+
+def init_bundle_mapping(save_index: bool = True):
+    bundle_files = list_bundle_files()
+
+    if index_cache_path and load_bundle_index(index_cache_path, bundle_files):
+        return
+
+    build_bundle_mapping(bundle_files)
+
+    if index_cache_path and save_index:
+        try:
+            save_bundle_index(index_cache_path, bundle_files)
+        except OSError:
+            pass
 
-def init_bundle_mapping():
+def build_bundle_mapping(bundle_files):
     bundle_contents = decompress_dsar(os.path.join(game_data_folder, "bundles.nxa"))
 
     num_packages = to_int(bundle_contents[0x10:0x14])
     num_bundles = to_int(bundle_contents[0x0C:0x10])
 
-    bundle_location = 0
     bundles = [[] for _ in range(num_bundles)]
 
     global package_contents
     package_contents = {}
-    global bundle_offsets
-    bundle_offsets = {}
+    global bundle_chunks
+    bundle_chunks = {}
     
     # get toc for each bundle:
-    for filename in os.listdir(game_data_folder):
-        if (not os.path.isdir(os.path.join(game_data_folder, filename))) and (".patch" not in filename) and (os.path.splitext(filename)[1] in ["", ".stream", ".nxa", ".gpu_resources"]):
-            bundle_name = os.path.basename(filename)
-            bundle_offsets[bundle_name] = {}
-            with open(os.path.join(game_data_folder, bundle_name), 'rb') as bundle:
-                bundle.seek(8)
-                num_chunks = read_int(bundle) # num data chunks
-                bundle.seek(0x20)
-                uncompressed_offsets = struct.unpack(f"<{'Q24x'*num_chunks}", bundle.read(0x20*num_chunks))
-                for j, offset in enumerate(uncompressed_offsets):
-                    bundle_offsets[bundle_name][offset] = j
+    for bundle_name, _, _ in bundle_files:
+        with open(os.path.join(game_data_folder, bundle_name), 'rb') as bundle:
+            bundle_chunks[bundle_name] = read_chunk_headers(bundle)
             
 
-    # check name of each package to find the right one
-    for n in range(num_packages):
-        bundle_location = 0x18 + n * 0x18
-        bundle_size = to_int(bundle_contents[bundle_location:bundle_location+8])
-        name_offset = to_int(bundle_contents[bundle_location+8:bundle_location+12])
-        i = 0
-        while bundle_contents[name_offset+i] != 0:
-            i += 1
-        name = bundle_contents[name_offset:name_offset+i].decode()
-        # parse all BundleEntries for each package
-        items_count = to_int(bundle_contents[bundle_location+12:bundle_location+16])
-        items_offset = to_int(bundle_contents[bundle_location+16:bundle_location+20])
-        for i in range(items_count):
-            bundle_entry = BundleEntry()
-            original_archive_offset = to_int(bundle_contents[items_offset + 0x10*i:items_offset + 0x10*i + 8])
-            uncompressed_bundle_offset = to_int(bundle_contents[items_offset + 0x10*i + 8:items_offset + 0x10*i + 12])
-            bundle_index = (bundle_contents[items_offset + 0x10*i + 0x0F])
-            bundle_entry.bundle_index = bundle_index
-            bundle_entry.start_offset = uncompressed_bundle_offset
-            bundle_entry.original_archive_offset = original_archive_offset
-            try:
-                package_contents[name].entries.append(bundle_entry)
-            except KeyError:
-                package_contents[name] = Package()
-                package_contents[name].name = name
-                package_contents[name].size = bundle_size
-                package_contents[name].entries = [bundle_entry]
+    contents = numpy.frombuffer(bundle_contents, dtype=numpy.uint8)
+    records = numpy.frombuffer(bundle_contents, dtype=PACKAGE_RECORD_DTYPE, count=num_packages, offset=0x18)
+
+    # names are null terminated; find the terminator of every name at once
+    name_offsets = records["name_offset"].astype(numpy.int64)
+    terminators = numpy.flatnonzero(contents == 0)
+    name_ends = terminators[numpy.searchsorted(terminators, name_offsets)]
+    names = [bytes(bundle_contents[start:end]).decode() for start, end in zip(name_offsets.tolist(), name_ends.tolist())]
+
+    # gather the 16 byte bundle items of every package into one table
+    items_counts = records["items_count"].astype(numpy.int64)
+    firsts = numpy.cumsum(items_counts) - items_counts
+    item_offsets = numpy.repeat(records["items_offset"].astype(numpy.int64) - 0x10 * firsts, items_counts) + 0x10 * numpy.arange(int(items_counts.sum()))
+    items = contents[item_offsets[:, None] + numpy.arange(0x10)].view(BUNDLE_ITEM_DTYPE).reshape(-1)
+    original_archive_offsets = numpy.ascontiguousarray(items["original_archive_offset"])
+    start_offsets = numpy.ascontiguousarray(items["start_offset"])
+    bundle_indices = numpy.ascontiguousarray(items["bundle_index"])
+
+    # packages listed more than once keep the size of their first record and the entries of all of them
+    sizes = records["size"].tolist()
+    for n, name in enumerate(names):
+        first = int(firsts[n])
+        last = first + int(items_counts[n])
+        try:
+            package = package_contents[name]
+        except KeyError:
+            package = Package()
+            package.name = name
+            package.size = sizes[n]
+            package_contents[name] = package
+        package.add_entries(original_archive_offsets[first:last], start_offsets[first:last], bundle_indices[first:last])
+
+def save_bundle_index(cache_path: str, bundle_files):
+
+    # index layout (little endian):
+    # header:   magic, version, bundle count, package count, entry count
+    # bundles:  name length, file size, mtime, chunk count, name, chunk headers
+    # packages: name length, package size, entry count, name
+    # entries:  original offsets (u64), bundle offsets (u32), bundle indices (u8) of every package, in package order
+
+    packages = list(package_contents.values())
+    num_entries = sum([len(package) for package in packages])
+    data = [struct.pack("<4sIIII", INDEX_MAGIC, INDEX_VERSION, len(bundle_files), len(packages), num_entries)]
+    for bundle_name, size, mtime in bundle_files:
+        name = bundle_name.encode()
+        chunks = bundle_chunks[bundle_name]
+        data.append(struct.pack("<HQQI", len(name), size, mtime, len(chunks)))
+        data.append(name)
+        data.append(chunks.tobytes())
+    for package in packages:
+        name = package.name.encode()
+        data.append(struct.pack("<HQI", len(name), package.size, len(package)))
+        data.append(name)
+    for field in ["original_archive_offsets", "start_offsets", "bundle_indices"]:
+        data.extend([getattr(package, field).tobytes() for package in packages])
+
+    # a unique temporary name, so concurrent saves never write into each other's file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_path) or ".", prefix=os.path.basename(cache_path), suffix=".tmp", delete=False) as f:
+        temp_path = f.name
+        f.write(b"".join(data))
+    try:
+        os.replace(temp_path, cache_path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+def load_bundle_index(cache_path: str, bundle_files) -> bool:
+
+    # returns False if the index is missing, corrupt, or was built for different bundle files
+
+    global package_contents
+    global bundle_chunks
+
+    try:
+        with open(cache_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            magic, version, num_bundles, num_packages, num_entries = struct.unpack_from("<4sIIII", index, 0)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or num_bundles != len(bundle_files):
+                return False
+            offset = 20
+            new_bundle_chunks = {}
+            for bundle_name, size, mtime in bundle_files:
+                name_length, cached_size, cached_mtime, num_chunks = struct.unpack_from("<HQQI", index, offset)
+                offset += 22
+                cached_name = index[offset:offset+name_length].decode()
+                offset += name_length
+                if (cached_name, cached_size, cached_mtime) != (bundle_name, size, mtime):
+                    return False
+                new_bundle_chunks[bundle_name] = numpy.frombuffer(index, dtype=CHUNK_HEADER_DTYPE, count=num_chunks, offset=offset).copy()
+                offset += 0x20 * num_chunks
+            packages = []
+            entry_counts = []
+            for _ in range(num_packages):
+                name_length, size, num_package_entries = struct.unpack_from("<HQI", index, offset)
+                offset += 14
+                package = Package()
+                package.name = index[offset:offset+name_length].decode()
+                package.size = size
+                offset += name_length
+                packages.append(package)
+                entry_counts.append(num_package_entries)
+            if sum(entry_counts) != num_entries:
+                return False
+            original_archive_offsets = numpy.frombuffer(index, dtype="<u8", count=num_entries, offset=offset).copy()
+            offset += 8 * num_entries
+            start_offsets = numpy.frombuffer(index, dtype="<u4", count=num_entries, offset=offset).copy()
+            offset += 4 * num_entries
+            bundle_indices = numpy.frombuffer(index, dtype="u1", count=num_entries, offset=offset).copy()
+            new_package_contents = {}
+            first = 0
+            for package, count in zip(packages, entry_counts):
+                package.add_entries(original_archive_offsets[first:first+count], start_offsets[first:first+count], bundle_indices[first:first+count])
+                first += count
+                new_package_contents[package.name] = package
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return False
+
+    bundle_chunks = new_bundle_chunks
+    package_contents = new_package_contents
+    return True
 
 def get_resources_from_bundle(bundle_path: str, start_offset: int, size: int):
 
@@ -193,15 +681,46 @@ def get_resources_from_bundle(bundle_path: str, start_offset: int, size: int):
     # returns resource from bundle file; resource determined by file offset in uncompressed bundle
     # handles resources split into multiple compressed chunks to return complete resource
 
+    reader = get_bundle_reader(bundle_path)
     current_size = 0
     resources = []
 
     while current_size < size:
-        resource = get_resource_from_bundle(bundle_path, start_offset + current_size)
+        resource = reader.read_resource(start_offset + current_size)
         current_size += len(resource)
         resources.append(resource)
     return resources
     
+def map_file(file_path: str) -> memoryview:
+
+    # maps the file read-only; the mapping is closed once the last view into it is released
+    # empty files cannot be mapped
+
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    mapped_files[mapping] = normalize_path(file_path)
+    return memoryview(mapping)
+
+def read_file(file_path: str) -> bytes:
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+def normalize_path(file_path: str) -> str:
+    return os.path.normcase(os.path.abspath(file_path))
+
+def is_file_mapped(file_path: str) -> bool:
+    return normalize_path(file_path) in mapped_files.values()
+
+def can_map_package(package_path: str) -> bool:
+
+    # only game packages are mapped. A file with a live mapping can't be replaced or truncated on Windows,
+    # so patches and anything outside the data folder, which the app may write back, are read instead
+
+    name = get_data_folder_name(package_path)
+    return bool(name) and ".patch_" not in name
+
 def get_package_toc(package_name: str):
     global package_contents
 
@@ -209,17 +728,7 @@ def get_package_toc(package_name: str):
 
     full_path = os.path.join(game_data_folder, package_name)
 
-    package_type = 0
-
-    if os.path.exists(full_path):
-        with open(full_path, 'rb') as f:
-            magic = int.from_bytes(f.read(4), "little")
-            if magic == 1380012868: # compressed DSAR file
-                package_type = DSAR
-            else:
-                package_type = LEGACY
-    else:
-        package_type = BUNDLED
+    package_type = get_package_type(full_path)
 
     if package_type == BUNDLED:
 
@@ -229,7 +738,7 @@ def get_package_toc(package_name: str):
             # print(f"Unable to get package {package_name}")
             return bytearray()
 
-        return get_resource_from_bundle(os.path.join(game_data_folder, f"bundles.{package.entries[0].bundle_index:02d}.nxa"), package.entries[0].start_offset)
+        return get_resource_from_bundle(os.path.join(game_data_folder, f"bundles.{int(package.bundle_indices[0]):02d}.nxa"), int(package.start_offsets[0]))
 
     elif package_type == DSAR:
 
@@ -237,35 +746,26 @@ def get_package_toc(package_name: str):
 
     elif package_type == LEGACY:
 
-        package_file = open(full_path, 'rb')
-        bin_data = b""
-        bin_data = package_file.read(12)
-        magic, numTypes, numFiles = struct.unpack("<III", bin_data)
+        package_data = map_file(full_path)
+        if len(package_data) < 12:
+            return bytearray()
+        magic, numTypes, numFiles = struct.unpack_from("<III", package_data)
         if magic != 4026531857:
-            package_file.close()
             return bytearray()
 
-        package_file.seek(0)
-        return package_file.read(72 + numTypes*32 + numFiles*80)
+        return package_data[:72 + numTypes*32 + numFiles*80]
 
     return bytearray()
 
-def load_package(package_path: str):
+def load_package(package_path: str, toc_only: bool = False):
+
+    # returns the toc, gpu_resources and stream parts of a package
+    # with toc_only, the gpu_resources part is skipped and the stream part is a PackageStream that is only decompressed where it is read
 
     if not os.path.dirname(package_path):
         package_path = os.path.join(game_data_folder, package_path)
 
-    package_type = 0
-
-    if os.path.exists(package_path):
-        with open(package_path, 'rb') as f:
-            magic = int.from_bytes(f.read(4), "little")
-            if magic == 1380012868: # compressed DSAR file
-                package_type = DSAR
-            else:
-                package_type = LEGACY
-    else:
-        package_type = BUNDLED
+    package_type = get_package_type(package_path)
 
     toc_data = bytearray()
     gpu_data = bytearray()
@@ -274,6 +774,9 @@ def load_package(package_path: str):
     if package_type == BUNDLED:
         content = reconstruct_package_from_bundles(package_path)
         if content: toc_data = content
+
+        if toc_only:
+            return toc_data, gpu_data, BundledPackageStream(f"{package_path}.stream")
         
         content = reconstruct_package_from_bundles(f"{package_path}.gpu_resources")
         if content: gpu_data = content
@@ -283,23 +786,132 @@ def load_package(package_path: str):
 
     elif package_type == DSAR:
         toc_data = decompress_dsar(package_path)
-        if os.path.exists(package_path+".gpu_resources"):
+
+        if toc_only:
+            return toc_data, gpu_data, DsarPackageStream(package_path+".stream")
+
+        if package_file_exists(package_path+".gpu_resources"):
             gpu_data = decompress_dsar(package_path+".gpu_resources")
-        if os.path.exists(package_path+".stream"):
+        if package_file_exists(package_path+".stream"):
             stream_data = decompress_dsar(package_path+".stream")
 
     elif package_type == LEGACY:
-        with open(package_path, 'rb') as f:
-            toc_data = f.read()
-        if os.path.exists(package_path+".gpu_resources"):
-            with open(package_path+".gpu_resources", 'rb') as f:
-                gpu_data = f.read()
-        if os.path.exists(package_path+".stream"):
-            with open(package_path+".stream", 'rb') as f:
-                stream_data = f.read()
+        # game packages are mapped rather than read; the parts are memoryviews and slicing them does not copy
+        read = map_file if can_map_package(package_path) else read_file
+        toc_data = read(package_path)
+        if not toc_only and package_file_exists(package_path+".gpu_resources"):
+            gpu_data = read(package_path+".gpu_resources")
+        stream_path = ""
+        if package_file_exists(package_path+".stream"):
+            stream_data = read(package_path+".stream")
+            if read == map_file:
+                stream_path = package_path+".stream"
+
+        if toc_only:
+            return toc_data, gpu_data, PackageStream(stream_data, stream_path)
 
     return toc_data, gpu_data, stream_data
 
+class PackageStream:
+
+    # read-only, seekable view of the stream part of a package
+    # subclasses only decompress the byte ranges that are actually read
+    # a stream over a mapped file is pickled as its path and mapped again when unpickled
+
+    def __init__(self, data: bytes | bytearray | memoryview = b"", path: str = ""):
+        self.data = data
+        self.size = len(data)
+        self.location = 0
+        self.path = path
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.path:
+            state["data"] = b""
+        elif isinstance(self.data, memoryview):
+            state["data"] = bytes(self.data)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.path:
+            self.data = map_file(self.path)
+
+    def __len__(self):
+        return self.size
+
+    def seek(self, location: int):
+        self.location = location
+
+    def tell(self) -> int:
+        return self.location
+
+    def read(self, length: int = -1) -> bytes | bytearray | memoryview:
+        if length == -1:
+            length = self.size - self.location
+        if self.location + length > self.size:
+            raise Exception("reading past end of stream")
+        data = self.read_range(self.location, length)
+        self.location += length
+        return data
+
+    def read_range(self, offset: int, size: int) -> bytes | bytearray | memoryview:
+        return self.data[offset:offset+size]
+
+class DsarPackageStream(PackageStream):
+
+    def __init__(self, stream_path: str):
+        super().__init__()
+        self.path = stream_path
+        if package_file_exists(stream_path):
+            self.size = get_bundle_reader(stream_path).size
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def read_range(self, offset: int, size: int) -> bytearray:
+        data = bytearray(size)
+        if size > 0:
+            wait_for(get_bundle_reader(self.path).read_into(memoryview(data), offset, size, get_decompression_pool()))
+        return data
+
+class BundledPackageStream(PackageStream):
+
+    def __init__(self, package_name: str):
+        super().__init__()
+        self.name = os.path.basename(package_name)
+        self.package = package_contents.get(self.name)
+        if self.package is not None:
+            self.size = self.package.size
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["package"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.package = package_contents.get(self.name)
+
+    def read_range(self, offset: int, size: int) -> bytearray:
+        data = bytearray(size)
+        if size <= 0:
+            return data
+        output = memoryview(data)
+        pool = get_decompression_pool()
+        futures = []
+        offsets = self.package.original_archive_offsets
+        first = max(int(numpy.searchsorted(offsets, offset, side="right")) - 1, 0)
+        last = int(numpy.searchsorted(offsets, offset + size, side="left"))
+        for item_offset, item_size, start_offset, bundle_index in self.package.get_entries(first, last):
+            start = max(offset, item_offset)
+            end = min(offset + size, item_offset + item_size)
+            if start < end:
+                reader = get_bundle_reader(os.path.join(game_data_folder, f"bundles.{bundle_index:02d}.nxa"))
+                futures.extend(reader.read_into(output[start-offset:end-offset], start_offset + start - item_offset, end - start, pool))
+        wait_for(futures)
+        return data
+
 def reconstruct_package_from_bundles(package_name: str):
 
     # reconstructs a package file from compressed bundle files
@@ -313,40 +925,262 @@ def reconstruct_package_from_bundles(package_name: str):
         return bytearray()
 
     package_data = bytearray(package.size)
-    size = 0
-    for i, item in enumerate(package.entries):
-        try:
-            item_size = package.entries[i+1].original_archive_offset - item.original_archive_offset
-        except IndexError:
-            item_size = package.size - item.original_archive_offset
-        size += item_size
-        resources = get_resources_from_bundle(os.path.join(game_data_folder, f"bundles.{item.bundle_index:02d}.nxa"), item.start_offset, item_size)
-        combined_data = b"".join(resources)
-        package_data[item.original_archive_offset:item.original_archive_offset+len(combined_data)] = combined_data
+    output = memoryview(package_data)
+    pool = get_decompression_pool()
+    futures = []
+    for item_offset, item_size, start_offset, bundle_index in package.get_entries():
+        reader = get_bundle_reader(os.path.join(game_data_folder, f"bundles.{bundle_index:02d}.nxa"))
+        futures.extend(reader.read_into(output[item_offset:item_offset+item_size], start_offset, item_size, pool))
+    wait_for(futures)
     return package_data
 
+def export_package_from_bundles(package_name: str, output_path: str) -> bool:
+
+    # writes a package file reconstructed from compressed bundle files straight to output_path
+    # each decompressed chunk is written at its offset in the package, so the package is never held in memory
+    # returns False if the package is not in the bundles
+
+    package_name = os.path.basename(package_name)
+
+    try:
+        package = package_contents[package_name]
+    except KeyError:
+        return False
+
+    with open(output_path, 'wb') as f:
+        f.truncate(package.size)
+        for item_offset, item_size, start_offset, bundle_index in package.get_entries():
+            reader = get_bundle_reader(os.path.join(game_data_folder, f"bundles.{bundle_index:02d}.nxa"))
+            reader.write_to(f, item_offset, start_offset, item_size)
+    return True
+
+def export_packages(package_names: list[str], output_folder: str, workers: int = 0) -> list[str]:
+
+    # exports every part (toc, gpu_resources, stream) of each package into output_folder, several files at a time
+    # returns the names of the files written
+
+    if workers <= 0:
+        workers = decompression_workers
+    file_names = []
+    for package_name in package_names:
+        package_name = os.path.basename(package_name)
+        for file_name in [package_name, f"{package_name}.gpu_resources", f"{package_name}.stream"]:
+            if file_name in package_contents and package_contents[file_name].size > 0:
+                file_names.append(file_name)
+
+    def export(file_name: str):
+        export_package_from_bundles(file_name, os.path.join(output_folder, file_name))
+
+    if workers <= 1:
+        for file_name in file_names:
+            export(file_name)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slim-export") as pool:
+            wait_for([pool.submit(export, file_name) for file_name in file_names])
+    # every chunk was read once, so nothing in the cache is likely to be read again
+    chunk_cache.clear()
+    return file_names
+
+class TocIndex:
+
+    # file_id -> (package, type_id, offsets) for every toc entry of every package in the data folder
+    # entries are sorted by file id so lookups are a binary search
+
+    def __init__(self, packages: list[str], entries: numpy.ndarray):
+        self.packages = packages
+        self.entries = entries
+        self.file_ids = entries["file_id"]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, file_id: int, type_id: int = 0) -> list[tuple[str, int, int, int, int, int]]:
+
+        # returns (package, type_id, toc_data_offset, toc_data_size, stream_file_offset, stream_size) of every matching entry
+
+        first = int(numpy.searchsorted(self.file_ids, file_id, side="left"))
+        last = int(numpy.searchsorted(self.file_ids, file_id, side="right"))
+        results = []
+        for entry in self.entries[first:last]:
+            if type_id and entry["type_id"] != type_id:
+                continue
+            results.append((
+                self.packages[entry["package"]], int(entry["type_id"]),
+                int(entry["toc_data_offset"]), int(entry["toc_data_size"]),
+                int(entry["stream_file_offset"]), int(entry["stream_size"])
+            ))
+        return results
+
+    def find_package(self, file_id: int, type_id: int = 0) -> str:
+
+        # returns the name of the first package containing the file, or "" if no package does
+
+        results = self.find(file_id, type_id)
+        return results[0][0] if results else ""
+
+def list_packages() -> list[str]:
+
+    # returns the name of every package in the data folder, whether it is stored in the bundles or on its own
+
+    packages = {name for name in package_contents if "." not in name}
+    packages.update([name for name in get_data_folder_files() if "." not in name and len(name) == 16])
+    return sorted(packages)
+
+def scan_package_toc(package_name: str) -> numpy.ndarray:
+
+    # returns the toc entries of a package without reading any of its data
+
+    toc = get_package_toc(package_name)
+    if len(toc) < 72:
+        return numpy.empty(0, dtype=TOC_ENTRY_DTYPE)
+    magic, num_types, num_files = struct.unpack_from("<III", toc)
+    if magic != TOC_MAGIC:
+        return numpy.empty(0, dtype=TOC_ENTRY_DTYPE)
+    entries_offset = 72 + num_types*32
+    if len(toc) < entries_offset + num_files*80:
+        # the first resource does not hold the whole toc
+        toc, _, _ = load_package(package_name, toc_only=True)
+        if len(toc) < entries_offset + num_files*80:
+            return numpy.empty(0, dtype=TOC_ENTRY_DTYPE)
+    return numpy.frombuffer(toc, dtype=TOC_ENTRY_DTYPE, count=num_files, offset=entries_offset).copy()
+
+def scan_package_tocs(package_names: list[str]) -> list[bytes]:
+
+    # toc scan worker; results are returned as raw bytes to keep pickling cheap
+
+    return [scan_package_toc(package_name).tobytes() for package_name in package_names]
+
+def build_toc_index(workers: int = 0) -> TocIndex:
+
+    # scans the toc of every package in the data folder; with more than one worker, batches of packages are scanned in worker processes
+
+    if workers <= 0:
+        workers = toc_scan_workers
+    packages = list_packages()
+    batches = [packages[i:i+toc_scan_batch_size] for i in range(0, len(packages), toc_scan_batch_size)]
+    if workers <= 1 or len(batches) <= 1:
+        results = [scan_package_tocs(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches)), initializer=slim_init, initargs=(game_data_folder, index_cache_path, False)) as pool:
+            results = list(pool.map(scan_package_tocs, batches))
+
+    tables = []
+    for package_index, toc in enumerate([toc for batch in results for toc in batch]):
+        toc_entries = numpy.frombuffer(toc, dtype=TOC_ENTRY_DTYPE)
+        table = numpy.empty(len(toc_entries), dtype=TOC_INDEX_DTYPE)
+        for field in TOC_INDEX_DTYPE.names:
+            if field != "package":
+                table[field] = toc_entries[field]
+        table["package"] = package_index
+        tables.append(table)
+    entries = numpy.concatenate(tables) if tables else numpy.empty(0, dtype=TOC_INDEX_DTYPE)
+    entries = entries[numpy.argsort(entries["file_id"], kind="stable")]
+    return TocIndex(packages, entries)
+
+def save_toc_index(cache_path: str, index: TocIndex, bundle_files):
+
+    # index layout (little endian):
+    # header:   magic, version, file count, package count, entry count
+    # files:    name length, file size, mtime, name
+    # packages: name length, name
+    # entries:  TOC_INDEX_DTYPE records sorted by file id
+
+    data = [struct.pack("<4sIIII", TOC_INDEX_MAGIC, TOC_INDEX_VERSION, len(bundle_files), len(index.packages), len(index.entries))]
+    for file_name, size, mtime in bundle_files:
+        name = file_name.encode()
+        data.append(struct.pack("<HQQ", len(name), size, mtime))
+        data.append(name)
+    for package_name in index.packages:
+        name = package_name.encode()
+        data.append(struct.pack("<H", len(name)))
+        data.append(name)
+    data.append(index.entries.tobytes())
+
+    # a unique temporary name, so concurrent saves never write into each other's file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_path) or ".", prefix=os.path.basename(cache_path), suffix=".tmp", delete=False) as f:
+        temp_path = f.name
+        f.write(b"".join(data))
+    try:
+        os.replace(temp_path, cache_path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+def load_toc_index(cache_path: str, bundle_files) -> TocIndex | None:
+
+    # returns None if the index is missing, corrupt, or was built for different package files
+
+    try:
+        with open(cache_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            magic, version, num_files, num_packages, num_entries = struct.unpack_from("<4sIIII", index, 0)
+            if magic != TOC_INDEX_MAGIC or version != TOC_INDEX_VERSION or num_files != len(bundle_files):
+                return None
+            offset = 20
+            for file_name, size, mtime in bundle_files:
+                name_length, cached_size, cached_mtime = struct.unpack_from("<HQQ", index, offset)
+                offset += 18
+                cached_name = index[offset:offset+name_length].decode()
+                offset += name_length
+                if (cached_name, cached_size, cached_mtime) != (file_name, size, mtime):
+                    return None
+            packages = []
+            for _ in range(num_packages):
+                name_length = struct.unpack_from("<H", index, offset)[0]
+                offset += 2
+                packages.append(index[offset:offset+name_length].decode())
+                offset += name_length
+            entries = numpy.frombuffer(index, dtype=TOC_INDEX_DTYPE, count=num_entries, offset=offset).copy()
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return None
+    return TocIndex(packages, entries)
+
+def get_toc_index(workers: int = 0) -> TocIndex:
+
+    # returns the toc index of the data folder, loading it from disk or scanning the packages if the saved one is stale
+    # the index is built by whichever caller needs it first; callers that arrive before it is done wait for it
+
+    global toc_index
+    if toc_index is not None:
+        return toc_index
+    with toc_index_lock:
+        if toc_index is not None:
+            return toc_index
+        bundle_files = list_bundle_files()
+        index = load_toc_index(toc_index_path, bundle_files) if toc_index_path else None
+        if index is None:
+            index = build_toc_index(workers)
+            if toc_index_path:
+                try:
+                    save_toc_index(toc_index_path, index, bundle_files)
+                except OSError:
+                    pass
+        toc_index = index
+        return toc_index
+
+def find_package(file_id: int, type_id: int = 0) -> str:
+
+    # returns the name of a package in the data folder containing the file, or "" if there is none
+
+    return get_toc_index().find_package(file_id, type_id)
+
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: <game data folder> <package name> [<output folder>]")
+        print("Usage: <game data folder> <package name> [<package name> ...] [<output folder>] [-j <workers>] [-m <chunk cache MiB>]")
         sys.exit()
-    game_data_folder = sys.argv[1]
-    package_name = sys.argv[2]
-    if len(sys.argv) == 3:
-        output_folder = "."
-    else:
-        output_folder = sys.argv[3]
-    slim_init(game_data_folder)
-    content = reconstruct_package_from_bundles(package_name)
-    if content:
-        with open(os.path.join(output_folder, package_name), 'wb') as f:
-            f.write(content)
-
-    content = reconstruct_package_from_bundles(f"{package_name}.gpu_resources")
-    if content:
-        with open(os.path.join(output_folder, f"{package_name}.gpu_resources"), 'wb') as f:
-            f.write(content)
-
-    content = reconstruct_package_from_bundles(f"{package_name}.stream")
-    if content:
-        with open(os.path.join(output_folder, f"{package_name}.stream"), 'wb') as f:
-            f.write(content)
\ No newline at end of file
+    args = sys.argv[1:]
+    workers = 0
+    if "-j" in args:
+        i = args.index("-j")
+        workers = int(args[i+1])
+        del args[i:i+2]
+    if "-m" in args:
+        i = args.index("-m")
+        set_chunk_cache_budget(int(args[i+1]) * 1024 * 1024)
+        del args[i:i+2]
+    slim_init(args[0])
+    package_names = args[1:]
+    output_folder = "."
+    if len(package_names) > 1 and package_names[-1] not in package_contents:
+        # the last argument is the output folder unless it names a package
+        output_folder = package_names.pop()
+    export_packages(package_names, output_folder, workers)
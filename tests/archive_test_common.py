@@ -0,0 +1,124 @@
+import os
+import random
+import struct
+
+import util
+
+from const import BANK, BANK_VERSION_KEY, PREFETCH_STREAM, STREAM, VORBIS
+from core import AudioSource, GameArchive, StringEntry, TextBank, WwiseBank, WwiseDep, WwiseStream
+from wwise_hierarchy_154 import WwiseHierarchy_154, HircEntry, Sound, BankSourceStruct, BaseParam
+
+
+# id of the bus every sound is routed to. It is in every bank, like the buses of the game banks are
+SHARED_ENTRY_ID = 900
+
+
+def make_sound(hierarchy_id: int, source_id: int, stream_type: int, mem_size: int = 0) -> Sound:
+    sound = Sound()
+    sound.hierarchy_type = 0x02
+    sound.hierarchy_id = hierarchy_id
+    source = BankSourceStruct()
+    source.plugin_id = VORBIS
+    source.stream_type = stream_type
+    source.source_id = source_id
+    source.mem_size = mem_size
+    sound.sources.append(source)
+    sound.baseParam = BaseParam()
+    sound.baseParam.directParentID = SHARED_ENTRY_ID
+    sound.baseParam.positioningParamData = bytearray(1)
+    sound.update_size()
+    return sound
+
+
+def build_archive(folder: str, name: str = "1111222233334444", seed: int = 0, num_banks: int = 3, sounds_per_bank: int = 6) -> str:
+    """
+    Write a small legacy archive into folder. Every bank has sounds with
+    in-bank, streamed and prefetched sources routed to a shared entry, and
+    the archive has a text bank.
+
+    @return - path of the archive
+    """
+    rng = random.Random(seed)
+    archive = GameArchive()
+    archive.name = name
+    archive.magic = 0xF0000011
+    archive.unknown = 0
+    archive.unk4Data = bytes(56)
+    hierarchy_id = 1000
+    source_id = 5000
+    for n in range(num_banks):
+        bank = WwiseBank()
+        bank.file_id = 0xABC000 + n
+        bank_header = struct.pack("<II", 154 ^ BANK_VERSION_KEY, bank.file_id) + bytes(16)
+        bank.bank_header = b"BKHD" + len(bank_header).to_bytes(4, "little") + bank_header
+        bank.bank_misc_data = b"STID" + (8).to_bytes(4, "little") + bytes(8)
+        dep = WwiseDep()
+        dep.skip = False
+        dep.tag = 0
+        dep.data = f"content/audio/bank{n}.bnk"
+        dep.data_size = len(dep.data)
+        dep.file_id = bank.file_id
+        bank.dep = dep
+        bank.hierarchy = WwiseHierarchy_154(soundbank=bank)
+        bank.media_index = []
+        # entries that are not sounds are only parsed on demand by a lazy load
+        for entry_id, size in ((SHARED_ENTRY_ID, 24), (hierarchy_id + 500, 8 + n)):
+            entry = HircEntry()
+            entry.hierarchy_type = 0x0E
+            entry.hierarchy_id = entry_id
+            entry.misc = bytearray(range(size))
+            entry.size = 4 + size
+            bank.hierarchy.entries[entry_id] = entry
+            entry.soundbanks.append(bank)
+            bank.hierarchy._categorized_entry(entry)
+        for k in range(sounds_per_bank):
+            hierarchy_id += 1
+            source_id += 1
+            audio = AudioSource()
+            audio.short_id = source_id
+            if k % 3 == 0:
+                sound = make_sound(hierarchy_id, source_id, BANK)
+                audio.stream_type = BANK
+                audio.set_data(rng.randbytes(rng.randint(50, 400)), notify_subscribers=False, set_modified=False)
+                bank.media_index.append(source_id)
+            else:
+                stream_type = STREAM if k % 3 == 1 else PREFETCH_STREAM
+                sound = make_sound(hierarchy_id, source_id, stream_type, 64 if stream_type == PREFETCH_STREAM else 0)
+                audio.stream_type = STREAM
+                audio.resource_id = util.murmur64_hash(f"content/audio/{source_id}".encode("utf-8"))
+                audio.set_data(rng.randbytes(rng.randint(500, 3000)), notify_subscribers=False, set_modified=False)
+                stream = WwiseStream()
+                stream.file_id = audio.resource_id
+                stream.set_source(audio)
+                archive.wwise_streams[stream.file_id] = stream
+                if stream_type == PREFETCH_STREAM:
+                    bank.media_index.append(source_id)
+            archive.audio_sources[source_id] = audio
+            bank.hierarchy.entries[hierarchy_id] = sound
+            sound.soundbanks.append(bank)
+            bank.hierarchy._categorized_entry(sound)
+        archive.wwise_banks[bank.file_id] = bank
+    text_bank = TextBank()
+    text_bank.file_id = 0x7E57
+    text_bank.language = 1
+    for i in range(20):
+        entry = StringEntry()
+        entry.string_id = i + 1
+        entry.text = f"string {i} " * rng.randint(1, 4)
+        entry.parent = text_bank
+        text_bank.entries[entry.string_id] = entry
+    archive.text_banks[text_bank.file_id] = text_bank
+    archive.to_file(folder)
+    return os.path.join(folder, name)
+
+
+def read_files(path: str) -> dict[str, bytes]:
+    """
+    @return - contents of the toc and stream files of the archive at path
+    """
+    files = {}
+    for suffix in ("", ".stream"):
+        if os.path.exists(path + suffix):
+            with open(path + suffix, "rb") as f:
+                files[suffix] = f.read()
+    return files
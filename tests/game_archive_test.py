@@ -0,0 +1,305 @@
+import os
+import tempfile
+import unittest
+
+import numpy
+
+import core
+import slim
+
+from tests.archive_test_common import SHARED_ENTRY_ID, build_archive, read_files
+from core import GameArchive, TocHeader
+from log import logger
+from util import MemoryStream, MemoryViewStream
+from wwise_hierarchy_154 import PropBundle
+
+
+class TestGameArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_folder = os.path.join(self.tmp.name, "data")
+        self.output_folder = os.path.join(self.tmp.name, "output")
+        os.mkdir(self.data_folder)
+        os.mkdir(self.output_folder)
+        # an empty legacy install
+        open(os.path.join(self.data_folder, "9ba626afa44a3aa3"), "wb").close()
+        slim.game_data_folder = self.data_folder
+        core.stream_resource_id_cache_path = ""
+        core.stream_resource_ids = None
+        self.archive_path = build_archive(self.data_folder)
+
+    def tearDown(self):
+        slim.game_data_folder = ""
+        slim.data_folder_files = None
+        slim.package_types = {}
+        slim.slim_version = None
+        core.stream_resource_id_cache_path = core.STREAM_ID_CACHE
+        core.stream_resource_ids = None
+        self.tmp.cleanup()
+
+    def assert_generate_cached(self, bank, audio_sources) -> bytes:
+        data = bytes(bank.generate(audio_sources))
+        self.assertIs(bank.generate(audio_sources), bank.generate(audio_sources))
+        bank.invalidate()
+        self.assertEqual(data, bytes(bank.generate(audio_sources)))
+        return data
+
+    def test_bank_output_cache(self):
+        logger.critical("Running test_bank_output_cache...")
+        mod = core.Mod("test", None)
+        mod.load_archive_file(self.archive_path)
+        audio_sources = mod.get_audio_sources()
+        bank = next(iter(mod.get_wwise_banks().values()))
+        sound = bank.hierarchy.get_sounds()[0]
+        audio = audio_sources[sound.sources[0].source_id]
+        original = self.assert_generate_cached(bank, audio_sources)
+
+        # every change to what the bank is generated from gives new output, and the same output as generating it again
+        audio.set_data(bytearray(b"RIFF" + bytes(200)))
+        audio_edited = self.assert_generate_cached(bank, audio_sources)
+        self.assertNotEqual(original, audio_edited)
+
+        audio.set_data(bytearray(b"RIFF" + bytes(100)))
+        audio_edited_again = self.assert_generate_cached(bank, audio_sources)
+        self.assertNotEqual(audio_edited, audio_edited_again)
+
+        edited = sound.from_bytes(sound.get_data())
+        edited.baseParam.propBundle = PropBundle(1, [3], [bytearray(b"\x00\x00\x80\x3f")])
+        sound.set_data(edited)
+        sound_edited = self.assert_generate_cached(bank, audio_sources)
+        self.assertNotEqual(audio_edited_again, sound_edited)
+
+        replacement = core.AudioSource()
+        replacement.set_data(bytearray(b"RIFF" + bytes(50)), notify_subscribers=False, set_modified=False)
+        audio_sources[audio.get_short_id()] = replacement
+        self.assertNotEqual(sound_edited, self.assert_generate_cached(bank, audio_sources))
+        audio_sources[audio.get_short_id()] = audio
+
+        # reverting restores the original output
+        mod.revert_all()
+        self.assertEqual(original, self.assert_generate_cached(bank, audio_sources))
+        archive = mod.get_game_archive(os.path.basename(self.archive_path))
+        archive.to_file(self.output_folder)
+        self.assertEqual(read_files(self.archive_path), read_files(os.path.join(self.output_folder, archive.name)))
+
+        # adding and removing archives never leaves a bank with stale output
+        sound.set_data(edited)
+        generated = {bank_id: bytes(bank.generate(audio_sources)) for bank_id, bank in mod.get_wwise_banks().items()}
+        other = build_archive(self.output_folder, "5555666677778888", seed=1, num_banks=1)
+        mod.load_archive_file(other)
+        mod.remove_game_archive(os.path.basename(self.archive_path))
+        for bank_id, bank in mod.get_wwise_banks().items():
+            data = bytes(bank.generate(audio_sources))
+            self.assertEqual(data, self.assert_generate_cached(bank, audio_sources))
+            self.assertEqual(generated[bank_id], data)
+
+    def test_round_trip(self):
+        logger.critical("Running test_round_trip...")
+        archive = GameArchive.from_file(self.archive_path)
+        archive.to_file(self.output_folder)
+        output_path = os.path.join(self.output_folder, archive.name)
+        self.assertEqual(read_files(self.archive_path), read_files(output_path))
+
+        # only the edited bank is regenerated, everything else is written as it was loaded
+        bank_id, bank = list(archive.wwise_banks.items())[1]
+        sound = bank.hierarchy.get_sounds()[0]
+        edited = sound.from_bytes(sound.get_data())
+        edited.baseParam.propBundle = PropBundle(1, [3], [bytearray(b"\x00\x00\x80\x3f")])
+        sound.set_data(edited)
+        archive.to_file(self.output_folder)
+        original = GameArchive.from_file(self.archive_path)
+        saved = GameArchive.from_file(output_path)
+        self.assertEqual(sorted(original.wwise_banks), sorted(saved.wwise_banks))
+        for file_id, original_bank in original.wwise_banks.items():
+            if file_id == bank_id:
+                self.assertNotEqual(bytes(original_bank.original_data), bytes(saved.wwise_banks[file_id].original_data))
+                self.assertEqual(bytes(bank.generate(archive.audio_sources)), bytes(saved.wwise_banks[file_id].original_data))
+            else:
+                unedited = archive.wwise_banks[file_id]
+                self.assertIs(unedited.original_data, unedited.get_toc_data(archive.audio_sources))
+                self.assertEqual(bytes(original_bank.original_data), bytes(saved.wwise_banks[file_id].original_data))
+        self.assertEqual(read_files(self.archive_path)[".stream"], read_files(output_path)[".stream"])
+        self.assertEqual(
+            [text_bank.get_toc_data() for text_bank in original.text_banks.values()],
+            [text_bank.get_toc_data() for text_bank in saved.text_banks.values()]
+        )
+
+    def test_toc_table(self):
+        logger.critical("Running test_toc_table...")
+        records = [
+            TocHeader.record(0x1234567890ABCDEF, core.WWISE_BANK, 0x1000, 0, 0x230, 0, 0),
+            TocHeader.record(0xFEDCBA0987654321, core.WWISE_STREAM, 0x1240, 0x4000, 0x10, 0x1234, 1),
+        ]
+        offset = 24
+        table = numpy.array(records, dtype=slim.TOC_ENTRY_DTYPE).tobytes()
+        toc_table = GameArchive.read_toc_table(MemoryViewStream(bytes(offset) + table), offset, len(records))
+        self.assertEqual(records, toc_table.tolist())
+
+        # every row has the layout of a TocHeader
+        stream = MemoryStream()
+        stream.write(table)
+        stream.seek(0)
+        for row in toc_table:
+            toc_header = TocHeader()
+            toc_header.from_memory_stream(stream)
+            self.assertEqual(row.tobytes(), toc_header.get_data())
+            self.assertEqual(int(row["file_id"]), toc_header.file_id)
+            self.assertEqual(int(row["type_id"]), toc_header.type_id)
+            self.assertEqual(int(row["toc_data_offset"]), toc_header.toc_data_offset)
+            self.assertEqual(int(row["stream_file_offset"]), toc_header.stream_file_offset)
+            self.assertEqual(int(row["toc_data_size"]), toc_header.toc_data_size)
+            self.assertEqual(int(row["stream_size"]), toc_header.stream_size)
+            self.assertEqual((16, 64), (toc_header.unknown3, toc_header.unknown4))
+            self.assertEqual(int(row["entry_index"]), toc_header.entry_index)
+
+        # and loading an archive reads the entries to_file wrote
+        archive = GameArchive.from_file(self.archive_path)
+        with open(self.archive_path, "rb") as f:
+            toc = f.read()
+        toc_table = GameArchive.read_toc_table(MemoryViewStream(toc), 72 + 32 * archive.num_types, archive.num_files)
+        self.assertEqual(sorted(archive.wwise_streams), sorted(row[0] for row in toc_table.tolist() if row[1] == core.WWISE_STREAM))
+        self.assertEqual(sorted(archive.wwise_banks), sorted(row[0] for row in toc_table.tolist() if row[1] == core.WWISE_BANK))
+        self.assertEqual(list(range(archive.num_files)), [row[-1] for row in toc_table.tolist()])
+
+    def test_lazy_hierarchy(self):
+        logger.critical("Running test_lazy_hierarchy...")
+        eager = GameArchive.from_file(self.archive_path)
+        lazy = GameArchive.from_file(self.archive_path, lazy_hierarchy=True)
+        self.assertNotIn(SHARED_ENTRY_ID, lazy.hierarchy_entries)
+        first_bank, second_bank = list(lazy.wwise_banks.values())[:2]
+
+        # entries parsed on demand are merged like eager ones: an id shared by banks is one entry
+        shared_entry = first_bank.hierarchy.get_entry(SHARED_ENTRY_ID)
+        self.assertIs(shared_entry, lazy.hierarchy_entries[SHARED_ENTRY_ID])
+        self.assertIs(shared_entry, second_bank.hierarchy.get_entry(SHARED_ENTRY_ID))
+        self.assertEqual([first_bank, second_bank], shared_entry.soundbanks[:2])
+        lazy.materialize_hierarchies()
+        self.assertEqual(sorted(eager.hierarchy_entries), sorted(lazy.hierarchy_entries))
+        self.assertEqual([], first_bank.hierarchy.materialize_listeners)
+
+        # edits give the same output as with an eager load
+        for archive in (eager, lazy):
+            sound = archive.wwise_banks[second_bank.get_id()].hierarchy.get_sounds()[0]
+            edited = sound.from_bytes(sound.get_data())
+            edited.baseParam.propBundle = PropBundle(1, [3], [bytearray(b"\x00\x00\x80\x3f")])
+            sound.set_data(edited)
+        eager.to_file(self.output_folder)
+        expected = read_files(os.path.join(self.output_folder, eager.name))
+        lazy.to_file(self.output_folder)
+        self.assertEqual(expected, read_files(os.path.join(self.output_folder, lazy.name)))
+
+        # and reach the mod the archive was added to
+        mod = core.Mod("test", None)
+        mod.load_archive_file(self.archive_path, lazy_hierarchy=True)
+        self.assertNotIn(SHARED_ENTRY_ID, mod.get_hierarchy_entries())
+        bank = list(mod.get_wwise_banks().values())[1]
+        shared_entry = bank.hierarchy.get_entry(SHARED_ENTRY_ID)
+        self.assertIs(shared_entry, mod.get_hierarchy_entry(SHARED_ENTRY_ID))
+        for bank in mod.get_wwise_banks().values():
+            self.assertIs(shared_entry, bank.hierarchy.get_entry(SHARED_ENTRY_ID))
+        self.assertEqual(sorted(eager.hierarchy_entries), sorted(mod.get_hierarchy_entries()))
+        mod.remove_game_archive(os.path.basename(self.archive_path))
+        self.assertEqual({}, mod.get_hierarchy_entries())
+        self.assertEqual({}, mod.hierarchy_count)
+
+        # archives sharing banks count their entries the same way either way
+        archive_files = [self.archive_path, build_archive(self.output_folder, "5555666677778888", seed=1)]
+        counts = []
+        for lazy_hierarchy in (False, True):
+            mod = core.Mod("test", None)
+            mod.load_archive_files(archive_files, workers=1, lazy_hierarchy=lazy_hierarchy)
+            for archive in mod.get_game_archives().values():
+                archive.materialize_hierarchies()
+            counts.append(mod.hierarchy_count)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bank_content_order(self):
+        logger.critical("Running test_bank_content_order...")
+        archive = GameArchive.from_file(self.archive_path)
+        bank = next(iter(archive.wwise_banks.values()))
+        source_ids = [sound.sources[0].source_id for sound in bank.hierarchy.get_sounds()]
+        self.assertEqual(source_ids, list(bank.get_content()))
+
+        # content is an ordered set: adding an id again keeps its place, removing and adding it moves it last
+        bank.add_content(source_ids[0])
+        bank.add_content(99)
+        self.assertEqual(source_ids + [99], list(bank.get_content()))
+        bank.remove_content(source_ids[1])
+        bank.remove_content(12345)
+        bank.add_content(source_ids[1])
+        expected = [source_ids[0]] + source_ids[2:] + [99, source_ids[1]]
+        self.assertEqual(expected, list(bank.get_content()))
+
+        bank.generate(archive.audio_sources)
+        archive.to_file(self.output_folder)
+        self.assertEqual(expected, list(bank.get_content()))
+        saved = GameArchive.from_file(os.path.join(self.output_folder, archive.name))
+        self.assertEqual(source_ids, list(saved.wwise_banks[bank.get_id()].get_content()))
+
+    def test_to_file_failure(self):
+        logger.critical("Running test_to_file_failure...")
+        archive = GameArchive.from_file(self.archive_path)
+        archive.to_file(self.output_folder)
+        output_path = os.path.join(self.output_folder, archive.name)
+        expected = read_files(output_path)
+
+        # a failure while writing the stream leaves both existing files as they were
+        audio = next(stream.audio_source for stream in archive.wwise_streams.values())
+        audio.size += 16
+        with self.assertRaises(RuntimeError):
+            archive.to_file(self.output_folder)
+        self.assertEqual(expected, read_files(output_path))
+        self.assertEqual(sorted([archive.name, archive.name + ".stream"]), sorted(os.listdir(self.output_folder)))
+
+    def test_overwrite_loaded_archive(self):
+        logger.critical("Running test_overwrite_loaded_archive...")
+        archive = GameArchive.from_file(self.archive_path)
+        self.assertTrue(slim.is_file_mapped(self.archive_path + ".stream"))
+        expected = read_files(self.archive_path)
+        audio_data = {source_id: bytes(audio.get_data()) for source_id, audio in archive.audio_sources.items()}
+
+        # writing over the package the archive was loaded from releases the mapping first
+        archive.to_file(self.data_folder)
+        self.assertFalse(slim.is_file_mapped(self.archive_path))
+        self.assertFalse(slim.is_file_mapped(self.archive_path + ".stream"))
+        self.assertEqual(expected, read_files(self.archive_path))
+        for source_id, data in audio_data.items():
+            self.assertEqual(data, bytes(archive.audio_sources[source_id].get_data()))
+
+        # patches are read, not mapped
+        patch_path = self.archive_path + ".patch_0"
+        for suffix, data in expected.items():
+            with open(patch_path + suffix, "wb") as f:
+                f.write(data)
+        patch = GameArchive.from_file(patch_path)
+        self.assertFalse(slim.is_file_mapped(patch_path + ".stream"))
+        patch.to_file(self.data_folder)
+        self.assertEqual(expected, read_files(patch_path))
+
+    def test_load_archive_files_without_data_folder(self):
+        logger.critical("Running test_load_archive_files_without_data_folder...")
+        # workers start even when the data folder is invalid, like the app itself
+        archive_files = [self.archive_path, build_archive(self.output_folder, "5555666677778888", seed=1)]
+        slim.game_data_folder = os.path.join(self.tmp.name, "missing")
+        for workers in (1, 2):
+            mod = core.Mod("test", None)
+            self.assertEqual([True, True], mod.load_archive_files(archive_files, workers=workers))
+            self.assertEqual(["1111222233334444", "5555666677778888"], sorted(mod.game_archives))
+
+    def test_load_archive_files_stream_resource_ids(self):
+        logger.critical("Running test_load_archive_files_stream_resource_ids...")
+        # the workers leave the cache alone, and the ids of the archives they loaded are saved once by this process
+        archive_files = [self.archive_path, build_archive(self.output_folder, "5555666677778888", seed=1, sounds_per_bank=9)]
+        core.stream_resource_id_cache_path = os.path.join(self.tmp.name, "stream_resource_ids.cache")
+        core.stream_resource_ids = None
+        mod = core.Mod("test", None)
+        self.assertEqual([True, True], mod.load_archive_files(archive_files, workers=2))
+        expected = {}
+        for archive in mod.game_archives.values():
+            for audio in archive.audio_sources.values():
+                if audio.resource_id:
+                    expected[audio.short_id] = audio.resource_id
+        self.assertTrue(expected)
+        self.assertEqual({"content/audio": expected}, core.load_stream_resource_ids(core.stream_resource_id_cache_path))
+        self.assertEqual([], [name for name in os.listdir(self.tmp.name) if name.endswith(".tmp")])
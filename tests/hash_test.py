@@ -0,0 +1,96 @@
+import random
+import timeit
+import unittest
+
+from ctypes import c_uint32
+
+from log import logger
+from util import murmur64_hash, murmur64_hash_many, fnv_30, fnv_30_many
+
+
+def reference_murmur64_hash(data: bytes, seed: int = 0) -> int:
+    # the big int implementation murmur64_hash replaced
+    m = 0xc6a4a7935bd1e995
+    r = 47
+    MASK = 2 ** 64 - 1
+    length = len(data)
+    h = seed ^ ((m * length) & MASK)
+    off = length & ~7
+    for i in range(0, off, 8):
+        k = sum(b << (j * 8) for j, b in enumerate(data[i:i + 8]))
+        k = (k * m) & MASK
+        k = k ^ (k >> r)
+        k = (k * m) & MASK
+        h = h ^ k
+        h = (h * m) & MASK
+    for i in reversed(range(off, length)):
+        h = h ^ (data[i] << ((i - off) * 8))
+    if length & 7:
+        h = (h * m) & MASK
+    h = h ^ (h >> r)
+    h = (h * m) & MASK
+    return h ^ (h >> r)
+
+
+def reference_fnv_30(data: bytes) -> int:
+    # ctypes implementation fnv_30 replaced
+    h = c_uint32(2166136261)
+    for b in data:
+        b = c_uint32(b)
+        h = c_uint32(h.value * 16777619)
+        h = c_uint32(h.value ^ b.value)
+    return c_uint32(c_uint32(h.value >> 30).value ^ c_uint32(h.value & ((1 << 30) - 1)).value).value
+
+
+def make_items(count: int, seed: int = 0) -> list[bytes]:
+    rng = random.Random(seed)
+    items = [f"content/audio/{rng.getrandbits(32)}".encode("utf-8") for _ in range(count // 2)]
+    items += [rng.randbytes(rng.randrange(0, 40)) for _ in range(count - len(items))]
+    return items
+
+
+class TestHash(unittest.TestCase):
+
+    def test_murmur64_hash(self):
+        logger.critical("Running test_murmur64_hash...")
+        expected = {
+            b"": 0x0,
+            b"a": 0x71717d2d36b6b11,
+            b"content/audio": 0x88df32493472f9c6,
+            b"content/audio/12345678": 0x4d964ec2914c621d,
+            b"content/audio/music/123456789": 0xad49f9760eac24e,
+        }
+        for data, resource_id in expected.items():
+            self.assertEqual(resource_id, murmur64_hash(data))
+            self.assertEqual(resource_id, murmur64_hash(bytearray(data)))
+        self.assertEqual(0x65f0c6de00db5d8e, murmur64_hash(b"abcdefgh", 0x1234))
+        self.assertEqual(list(expected.values()), murmur64_hash_many(expected.keys()))
+
+    def test_batch_hashes(self):
+        logger.critical("Running test_batch_hashes...")
+        items = make_items(2000)
+        self.assertEqual([reference_murmur64_hash(item) for item in items], murmur64_hash_many(items))
+        self.assertEqual([reference_murmur64_hash(item, 0x1234) for item in items], murmur64_hash_many(items, 0x1234))
+        self.assertEqual([reference_fnv_30(item) for item in items], [fnv_30(item) for item in items])
+        self.assertEqual([reference_fnv_30(item) for item in items], fnv_30_many(items))
+        self.assertEqual([], murmur64_hash_many([]))
+        self.assertEqual([], fnv_30_many([]))
+
+
+def benchmark(count: int = 20000):
+    items = make_items(count)
+    timings = {
+        "reference_murmur64_hash": lambda: [reference_murmur64_hash(item) for item in items],
+        "murmur64_hash": lambda: [murmur64_hash(item) for item in items],
+        "murmur64_hash_many": lambda: murmur64_hash_many(items),
+        "reference_fnv_30": lambda: [reference_fnv_30(item) for item in items],
+        "fnv_30": lambda: [fnv_30(item) for item in items],
+        "fnv_30_many": lambda: fnv_30_many(items),
+    }
+    for name, func in timings.items():
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print(f"{name:24} {seconds * 1e6 / count:8.3f} us/item")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,75 @@
+import struct
+import unittest
+
+from log import logger
+from wwise_hierarchy_154 import WwiseHierarchy_154, HircEntry, Sound, BankSourceStruct, BaseParam
+
+
+def make_sound(hierarchy_id: int, source_id: int, parent_id: int) -> Sound:
+    sound = Sound()
+    sound.hierarchy_type = 0x02
+    sound.hierarchy_id = hierarchy_id
+    source = BankSourceStruct()
+    source.plugin_id = 0x00040001
+    source.source_id = source_id
+    sound.sources.append(source)
+    sound.baseParam = BaseParam()
+    sound.baseParam.directParentID = parent_id
+    sound.baseParam.positioningParamData = bytearray(1)
+    sound.update_size()
+    return sound
+
+
+def make_entry(hierarchy_type: int, hierarchy_id: int, size: int) -> HircEntry:
+    entry = HircEntry()
+    entry.hierarchy_type = hierarchy_type
+    entry.hierarchy_id = hierarchy_id
+    entry.misc = bytearray(range(size))
+    entry.size = 4 + size
+    return entry
+
+
+class TestLazyHierarchy(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = [
+            make_entry(0x0E, 10, 40),
+            make_sound(11, 5000, 10),
+            make_entry(0x0F, 12, 12),
+            make_entry(0x11, 13, 20),
+        ]
+        self.data = struct.pack("<I", len(self.entries)) + b"".join(bytes(e.get_data()) for e in self.entries)
+
+    def test_lazy_load(self):
+        logger.critical("Running test_lazy_load...")
+        hirc = WwiseHierarchy_154()
+        hirc.load(memoryview(self.data), lazy=True)
+        self.assertEqual([11, 13], list(hirc.entries.keys()))
+        self.assertEqual([10, 12], list(hirc.pending_entries.keys()))
+        self.assertEqual(1, len(hirc.get_sounds()))
+        self.assertTrue(hirc.has_entry(12))
+        self.assertIsNone(hirc.get_sounds()[0].parent)
+
+        # a pending entry parses the rest of the hierarchy, in chunk order
+        self.assertEqual(0x0F, hirc.get_entry(12).hierarchy_type)
+        self.assertTrue(hirc.is_materialized())
+        self.assertEqual([10, 11, 12, 13], list(hirc.entries.keys()))
+        self.assertIs(hirc.entries[10], hirc.get_sounds()[0].parent)
+        self.assertEqual(self.data, bytes(hirc.get_data()))
+
+    def test_lazy_materialize_keeps_modifications(self):
+        logger.critical("Running test_lazy_materialize_keeps_modifications...")
+        hirc = WwiseHierarchy_154(soundbank=object())
+        hirc.load(self.data, lazy=True)
+        hirc.get_sounds()[0].raise_modified()
+        new_entries = hirc.materialize()
+        self.assertEqual([10, 12], [e.get_id() for e in new_entries])
+        self.assertEqual(1, hirc.entries[10].modified_children)
+
+    def test_eager_load(self):
+        logger.critical("Running test_eager_load...")
+        hirc = WwiseHierarchy_154()
+        hirc.load(self.data)
+        self.assertEqual([10, 11, 12, 13], list(hirc.entries.keys()))
+        self.assertEqual({}, hirc.pending_entries)
+        self.assertEqual(self.data, bytes(hirc.get_data()))
@@ -0,0 +1,92 @@
+import io
+import struct
+import unittest
+
+from log import logger
+from util import MemoryStream, MemoryViewStream, BufferList, write_16_byte_aligned
+
+
+class TestMemoryStream(unittest.TestCase):
+
+    def test_memory_view_stream(self):
+        logger.critical("Running test_memory_view_stream...")
+        data = bytearray(struct.pack("<IQ", 7, 1 << 40) + b"BKHD" + bytes(12))
+        stream = MemoryViewStream(data)
+        self.assertEqual(7, stream.uint32_read())
+        self.assertEqual(1 << 40, stream.uint64_read())
+        tag = stream.read(4)
+        self.assertIsInstance(tag, memoryview)
+        self.assertEqual(b"BKHD", tag)
+
+        # reads are views into the original buffer
+        data[12] = ord("X")
+        self.assertEqual(b"XKHD", tag)
+
+        stream.advance(-100)
+        self.assertEqual(0, stream.tell())
+        stream.seek(len(data) - 4)
+        self.assertEqual(bytes(4), stream.read())
+        with self.assertRaises(Exception):
+            stream.read(1)
+        with self.assertRaises(Exception):
+            stream.write(b"\x00")
+
+    def test_memory_stream_reads_copy(self):
+        logger.critical("Running test_memory_stream_reads_copy...")
+        data = bytearray(b"BKHD")
+        stream = MemoryStream(data)
+        tag = stream.read(4)
+        data[0] = ord("X")
+        self.assertEqual(b"BKHD", tag)
+
+    def test_read_struct(self):
+        logger.critical("Running test_read_struct...")
+        data = struct.pack("<IIB", 1, 2, 3) + struct.pack(">H", 4) + struct.pack("<f", 0.5)
+        for stream in (MemoryStream(data), MemoryViewStream(data)):
+            self.assertEqual((1, 2, 3), stream.read_struct("<IIB"))
+            self.assertEqual(9, stream.tell())
+            stream.endian = ">"
+            self.assertEqual((4,), stream.read_struct("H"))
+            stream.endian = "<"
+            self.assertEqual(0.5, stream.float_read())
+            with self.assertRaises(Exception):
+                stream.read_struct("<B")
+            self.assertEqual(len(data), stream.tell())
+
+    def test_write_buffer(self):
+        logger.critical("Running test_write_buffer...")
+        stream = MemoryStream()
+        stream.write(b"abc")
+        stream.write(memoryview(b"defg"))
+        self.assertGreaterEqual(len(stream.buffer), 7)
+        self.assertEqual(b"abcdefg", stream.getbuffer())
+
+        # seeking past the end pads with zeros
+        stream.seek(10)
+        stream.write(bytearray(b"hi"))
+        stream.seek(1)
+        stream.write(b"B")
+        self.assertEqual(12, stream.size)
+        self.assertEqual(b"aBcdefg\x00\x00\x00hi", stream.getbuffer())
+
+        stream.seek(stream.size)
+        for _ in range(100):
+            stream.write(b"0123456789")
+        self.assertLessEqual(stream.size, len(stream.buffer))
+        self.assertEqual(b"aBcdefg\x00\x00\x00hi" + b"0123456789" * 100, stream.data)
+        self.assertEqual(len(stream.data), len(stream.buffer))
+        stream.seek(0)
+        self.assertEqual(b"aBc", stream.read(3))
+
+    def test_buffer_list(self):
+        logger.critical("Running test_buffer_list...")
+        payload = bytearray(b"payload")
+        data = BufferList([b"head", memoryview(payload)[:3]])
+        data.append(BufferList([payload]))
+        self.assertEqual(14, len(data))
+        self.assertIs(payload, data.buffers[-1])
+        self.assertEqual(b"headpaypayload", bytes(data))
+
+        f = io.BytesIO()
+        self.assertEqual(16, write_16_byte_aligned(f, data))
+        self.assertEqual(b"headpaypayload" + bytes(2), f.getvalue())
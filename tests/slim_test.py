@@ -0,0 +1,436 @@
+import os
+import pickle
+import random
+import struct
+import tempfile
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from lz4 import block
+
+import slim
+from log import logger
+
+
+def build_dsar(chunks: list[tuple[bytes, bool, bool]]) -> bytes:
+    """
+    @param chunks - (uncompressed data, starts a resource, compress) per chunk
+    """
+    header = bytearray(0x20 + 0x20 * len(chunks))
+    header[0:4] = struct.pack("<I", 1380012868)
+    header[8:12] = struct.pack("<I", len(chunks))
+    body = bytearray()
+    uncompressed_offset = 0
+    for i, (data, start, compress) in enumerate(chunks):
+        payload = block.compress(data, store_size=False) if compress else data
+        struct.pack_into(
+            "<QQIIBB6x", header, 0x20 + 0x20 * i,
+            uncompressed_offset, len(header) + len(body), len(data), len(payload),
+            slim.COMPRESSED if compress else slim.UNCOMPRESSED,
+            slim.START if start else slim.CONTINUE
+        )
+        body += payload
+        uncompressed_offset += len(data)
+    return bytes(header + body)
+
+
+def build_toc(entries: list[tuple[int, int, int, int]]) -> bytes:
+    """
+    @param entries - (file_id, type_id, toc_data_offset, toc_data_size) per toc entry
+    """
+    toc = struct.pack("<III", slim.TOC_MAGIC, 1, len(entries)) + bytes(60 + 32)
+    for i, (file_id, type_id, toc_data_offset, toc_data_size) in enumerate(entries):
+        toc += struct.pack("<QQQQQQQIIIIII", file_id, type_id, toc_data_offset, 0, 0, 0, 0, toc_data_size, 0, 0, 16, 64, i)
+    return toc
+
+
+def build_slim_install(folder: str, seed: int = 0, contents: dict[str, bytes] | None = None) -> dict[str, bytes]:
+    """
+    Write a small slim install (bundles.nxa plus two bundle files) into folder.
+
+    @param contents - fixed contents for some of the packages; the others are random
+    @return - expected reconstructed contents of every package
+    """
+    rng = random.Random(seed)
+    names = [
+        "0123456789abcdef", "0123456789abcdef.stream",
+        "fedcba9876543210", "fedcba9876543210.gpu_resources",
+    ]
+    bundles: list[list[tuple[bytes, bool, bool]]] = [[], []]
+    records = []
+    expected = {}
+    for name in names:
+        items = []
+        package = bytearray()
+        if contents and name in contents:
+            bundle_index = rng.randint(0, 1)
+            start_offset = sum(len(chunk[0]) for chunk in bundles[bundle_index])
+            items.append((0, start_offset, bundle_index))
+            bundles[bundle_index].append((contents[name], True, True))
+            package += contents[name]
+        for _ in range(0 if contents and name in contents else rng.randint(1, 4)):
+            bundle_index = rng.randint(0, 1)
+            start_offset = sum(len(chunk[0]) for chunk in bundles[bundle_index])
+            items.append((len(package), start_offset, bundle_index))
+            for j in range(rng.randint(1, 3)):
+                data = bytes(rng.choice((0, 7, rng.getrandbits(8))) for _ in range(rng.randint(16, 2048)))
+                bundles[bundle_index].append((data, j == 0, rng.random() < 0.7))
+                package += data
+        records.append((name, len(package), items))
+        expected[name] = bytes(package)
+
+    for i, chunks in enumerate(bundles):
+        with open(os.path.join(folder, f"bundles.{i:02d}.nxa"), "wb") as f:
+            f.write(build_dsar(chunks))
+
+    table = bytearray(0x18 + 0x18 * len(records))
+    struct.pack_into("<II", table, 0x0C, len(bundles), len(records))
+    strings = b"".join(name.encode() + b"\x00" for name in names)
+    strings += bytes(-(len(table) + len(strings)) % 16)
+    name_offset = len(table)
+    items_data = bytearray()
+    for n, (name, size, items) in enumerate(records):
+        items_offset = len(table) + len(strings) + len(items_data)
+        struct.pack_into("<QIII", table, 0x18 + 0x18 * n, size, name_offset, len(items), items_offset)
+        name_offset += len(name) + 1
+        for original_archive_offset, start_offset, bundle_index in items:
+            items_data += struct.pack("<QI3xB", original_archive_offset, start_offset, bundle_index)
+    package_table = bytes(table + strings + items_data)
+    with open(os.path.join(folder, "bundles.nxa"), "wb") as f:
+        f.write(build_dsar([
+            (package_table[i:i+256], True, True) for i in range(0, len(package_table), 256)
+        ]))
+
+    return expected
+
+
+class TestSlim(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_folder = os.path.join(self.tmp.name, "data")
+        os.mkdir(self.data_folder)
+        self.cache_path = os.path.join(self.tmp.name, "bundle_index.cache")
+        self.expected = build_slim_install(self.data_folder)
+
+    def tearDown(self):
+        slim.close_bundle_readers()
+        slim.game_data_folder = ""
+        slim.package_contents = {}
+        slim.bundle_chunks = {}
+        slim.chunk_cache.clear()
+        slim.toc_index = None
+        slim.data_folder_files = None
+        slim.package_types = {}
+        slim.slim_version = None
+        self.tmp.cleanup()
+
+    def _assert_packages(self):
+        for name, content in self.expected.items():
+            self.assertEqual(content, bytes(slim.reconstruct_package_from_bundles(name)))
+
+    def test_reconstruct_package(self):
+        logger.critical("Running test_reconstruct_package...")
+        slim.slim_init(self.data_folder, self.cache_path)
+        self._assert_packages()
+
+    def test_bundle_index_cache(self):
+        logger.critical("Running test_bundle_index_cache...")
+        slim.slim_init(self.data_folder, self.cache_path)
+        self.assertTrue(os.path.exists(self.cache_path))
+
+        slim.package_contents = {}
+        slim.bundle_chunks = {}
+        self.assertTrue(slim.load_bundle_index(self.cache_path, slim.list_bundle_files()))
+        self._assert_packages()
+
+        # a game update changes bundle mtimes, which must invalidate the index
+        os.utime(os.path.join(self.data_folder, "bundles.00.nxa"), ns=(0, 0))
+        self.assertFalse(slim.load_bundle_index(self.cache_path, slim.list_bundle_files()))
+        slim.slim_init(self.data_folder, self.cache_path)
+        self.assertTrue(slim.load_bundle_index(self.cache_path, slim.list_bundle_files()))
+        self._assert_packages()
+        self.assertEqual([], [name for name in os.listdir(self.tmp.name) if name.endswith(".tmp")])
+
+        # worker processes build the index for themselves without saving it
+        os.remove(self.cache_path)
+        slim.slim_init(self.data_folder, self.cache_path, save_index=False)
+        self._assert_packages()
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_bundle_reader(self):
+        logger.critical("Running test_bundle_reader...")
+        bundle_path = os.path.join(self.data_folder, "bundles.00.nxa")
+        reader = slim.BundleReader(bundle_path)
+        content = b"".join([reader.read_chunk(i) for i in range(len(reader.chunks))])
+        self.assertEqual(reader.size, len(content))
+
+        rng = random.Random(1)
+        for _ in range(200):
+            offset = rng.randrange(reader.size)
+            size = rng.randrange(reader.size - offset + 1)
+            self.assertEqual(content[offset:offset+size], reader.read(offset, size))
+
+        # only the chunks overlapping the range are touched
+        first, last = reader.chunk_range(int(reader.chunk_offsets[1]), 1)
+        self.assertEqual((1, 2), (first, last))
+
+        # a file with the name of an indexed bundle, but outside the data folder, is read with its own chunk headers
+        slim.slim_init(self.data_folder, self.cache_path)
+        content = os.urandom(300)
+        outside_path = os.path.join(self.tmp.name, "bundles.00.nxa")
+        with open(outside_path, "wb") as f:
+            f.write(build_dsar([(content[:100], True, True), (content[100:], False, False)]))
+        self.assertIsNot(slim.bundle_chunks["bundles.00.nxa"], slim.get_bundle_reader(outside_path).chunks)
+        self.assertEqual(content, slim.get_bundle_reader(outside_path).read(0, len(content)))
+        self.assertIs(slim.bundle_chunks["bundles.00.nxa"], slim.get_bundle_reader(bundle_path).chunks)
+        reader.close()
+
+    def test_parallel_decompression(self):
+        logger.critical("Running test_parallel_decompression...")
+        slim.slim_init(self.data_folder, self.cache_path)
+        bundle_path = os.path.join(self.data_folder, "bundles.01.nxa")
+        workers = slim.decompression_workers
+        try:
+            slim.decompression_workers = 1
+            serial = slim.decompress_dsar(bundle_path)
+            slim.decompression_workers = 4
+            self.assertEqual(serial, slim.decompress_dsar(bundle_path))
+            self._assert_packages()
+        finally:
+            slim.decompression_workers = workers
+
+    def test_lazy_package_stream(self):
+        logger.critical("Running test_lazy_package_stream...")
+        slim.slim_init(self.data_folder, self.cache_path)
+        toc_data, gpu_data, stream = slim.load_package("0123456789abcdef", toc_only=True)
+        self.assertEqual(self.expected["0123456789abcdef"], bytes(toc_data))
+        self.assertEqual(0, len(gpu_data))
+
+        content = self.expected["0123456789abcdef.stream"]
+        self.assertEqual(len(content), len(stream))
+        rng = random.Random(2)
+        for _ in range(100):
+            offset = rng.randrange(len(content))
+            size = rng.randrange(len(content) - offset + 1)
+            stream.seek(offset)
+            self.assertEqual(content[offset:offset+size], bytes(stream.read(size)))
+            self.assertEqual(offset + size, stream.tell())
+
+        _, _, stream = slim.load_package("fedcba9876543210", toc_only=True)
+        self.assertEqual(0, len(stream))
+
+    def test_chunk_cache(self):
+        logger.critical("Running test_chunk_cache...")
+        slim.slim_init(self.data_folder, self.cache_path)
+        slim.chunk_cache.clear()
+        budget = slim.chunk_cache_budget
+        try:
+            reader = slim.get_bundle_reader(os.path.join(self.data_folder, "bundles.00.nxa"))
+            compressed = [i for i in range(len(reader.chunks)) if reader.chunks["compression_type"][i] == slim.COMPRESSED]
+            first = reader.read_chunk(compressed[0])
+            self.assertEqual((0, 1), (slim.chunk_cache.hits, slim.chunk_cache.misses))
+            self.assertIs(first, reader.read_chunk(compressed[0]))
+            self.assertEqual((1, 1), (slim.chunk_cache.hits, slim.chunk_cache.misses))
+
+            # the package getters go through the same cache
+            self._assert_packages()
+            hits = slim.chunk_cache.hits
+            self._assert_packages()
+            self.assertGreater(slim.chunk_cache.hits, hits)
+
+            # shrinking the budget evicts the least recently used chunks
+            reader.read_chunk(compressed[-1])
+            slim.set_chunk_cache_budget(len(reader.read_chunk(compressed[-1])))
+            self.assertLessEqual(slim.chunk_cache.size, slim.chunk_cache_budget)
+            self.assertEqual([(reader.key, compressed[-1])], list(slim.chunk_cache.chunks))
+            self._assert_packages()
+
+            slim.set_chunk_cache_budget(0)
+            self.assertEqual(0, slim.chunk_cache.size)
+            self._assert_packages()
+            self.assertEqual(0, slim.chunk_cache.size)
+        finally:
+            slim.set_chunk_cache_budget(budget)
+
+    def test_mapped_legacy_package(self):
+        logger.critical("Running test_mapped_legacy_package...")
+        slim.slim_init(self.data_folder, self.cache_path)
+        toc = struct.pack("<III", 0xF0000011, 1, 2) + bytes(60 + 32 + 2 * 80)
+        package = toc + bytes(range(256)) * 4
+        stream = os.urandom(4096)
+        package_path = os.path.join(self.data_folder, "aaaabbbbccccdddd")
+        with open(package_path, "wb") as f:
+            f.write(package)
+        with open(package_path + ".stream", "wb") as f:
+            f.write(stream)
+        with open(package_path + ".gpu_resources", "wb") as f:
+            pass
+
+        self.assertEqual(toc, bytes(slim.get_package_toc("aaaabbbbccccdddd")))
+
+        toc_data, gpu_data, stream_data = slim.load_package(package_path)
+        self.assertIsInstance(toc_data, memoryview)
+        self.assertEqual(package, bytes(toc_data))
+        self.assertEqual(0, len(gpu_data))
+        self.assertEqual(stream, bytes(stream_data))
+
+        _, _, stream_data = slim.load_package(package_path, toc_only=True)
+        audio = stream_data.read_range(100, 1000)
+        self.assertIsInstance(audio, memoryview)
+        self.assertIs(stream_data.data.obj, audio.obj)
+        self.assertEqual(stream[100:1100], bytes(audio))
+        self.assertTrue(slim.is_file_mapped(package_path + ".stream"))
+        # a second mapping of the same file going away leaves the first one tracked
+        _, _, other = slim.load_package(package_path, toc_only=True)
+        del other
+        self.assertTrue(slim.is_file_mapped(package_path + ".stream"))
+        del toc_data, stream_data, audio
+        self.assertFalse(slim.is_file_mapped(package_path + ".stream"))
+
+        # patches and packages outside the data folder may be written back, so they are read instead
+        for path in (package_path + ".patch_0", os.path.join(self.tmp.name, "aaaabbbbccccdddd")):
+            for suffix in ("", ".stream"):
+                with open(path + suffix, "wb") as f:
+                    f.write(package if not suffix else stream)
+            toc_data, _, stream_data = slim.load_package(path, toc_only=True)
+            self.assertNotIsInstance(toc_data, memoryview)
+            self.assertEqual(package, toc_data)
+            self.assertEqual(stream[100:1100], bytes(stream_data.read_range(100, 1000)))
+            self.assertEqual("", stream_data.path)
+            self.assertFalse(slim.is_file_mapped(path))
+
+    def test_pickle_package_stream(self):
+        logger.critical("Running test_pickle_package_stream...")
+        slim.slim_init(self.data_folder, self.cache_path)
+        _, _, stream = slim.load_package("0123456789abcdef", toc_only=True)
+        copy = pickle.loads(pickle.dumps(stream))
+        self.assertIsNone(stream.__getstate__()["package"])
+        self.assertEqual(self.expected["0123456789abcdef.stream"], bytes(copy.read_range(0, len(copy))))
+
+        # a legacy stream is sent as its path and mapped again
+        stream_path = os.path.join(self.data_folder, "aaaabbbbccccdddd.stream")
+        with open(stream_path, "wb") as f:
+            f.write(os.urandom(4096))
+        with open(os.path.join(self.data_folder, "aaaabbbbccccdddd"), "wb") as f:
+            f.write(struct.pack("<III", 0xF0000011, 0, 0) + bytes(60))
+        _, _, stream = slim.load_package(os.path.join(self.data_folder, "aaaabbbbccccdddd"), toc_only=True)
+        data = pickle.dumps(stream)
+        self.assertLess(len(data), 1024)
+        copy = pickle.loads(data)
+        self.assertEqual(bytes(stream.read_range(0, 4096)), bytes(copy.read_range(0, 4096)))
+
+    def test_toc_index(self):
+        logger.critical("Running test_toc_index...")
+        bundled_toc = build_toc([(1, 5, 0x100, 16), (2, 6, 0x110, 32)])
+        legacy_toc = build_toc([(2, 6, 0x200, 48), (3, 7, 0x230, 8)])
+        build_slim_install(self.data_folder, contents={"0123456789abcdef": bundled_toc})
+        with open(os.path.join(self.data_folder, "aaaabbbbccccdddd"), "wb") as f:
+            f.write(legacy_toc + bytes(64))
+        slim.slim_init(self.data_folder, self.cache_path)
+        slim.toc_index_path = os.path.join(self.tmp.name, "toc_index.cache")
+        try:
+            index = slim.get_toc_index(workers=1)
+            self.assertEqual(["0123456789abcdef", "aaaabbbbccccdddd", "fedcba9876543210"], index.packages)
+            self.assertEqual(4, len(index))
+            self.assertEqual([("0123456789abcdef", 5, 0x100, 16, 0, 0)], index.find(1))
+            self.assertEqual({"0123456789abcdef", "aaaabbbbccccdddd"}, {result[0] for result in index.find(2, 6)})
+            self.assertEqual("aaaabbbbccccdddd", slim.find_package(3, 7))
+            self.assertEqual("", slim.find_package(3, 6))
+            self.assertEqual("", slim.find_package(4))
+
+            saved = slim.load_toc_index(slim.toc_index_path, slim.list_bundle_files())
+            self.assertEqual(index.packages, saved.packages)
+            self.assertEqual(index.entries.tobytes(), saved.entries.tobytes())
+
+            # scanning in worker processes gives the same index
+            batch_size = slim.toc_scan_batch_size
+            slim.toc_scan_batch_size = 1
+            try:
+                self.assertEqual(index.entries.tobytes(), slim.build_toc_index(workers=2).entries.tobytes())
+            finally:
+                slim.toc_scan_batch_size = batch_size
+
+            # lookups from several threads share the index the first of them builds
+            slim.slim_init(self.data_folder, self.cache_path)
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                indexes = list(pool.map(lambda _: slim.get_toc_index(workers=1), range(8)))
+            self.assertTrue(all(other is indexes[0] for other in indexes))
+            self.assertEqual(index.entries.tobytes(), indexes[0].entries.tobytes())
+
+            # any change to the packages invalidates the saved index
+            os.utime(os.path.join(self.data_folder, "aaaabbbbccccdddd"), ns=(0, 0))
+            self.assertIsNone(slim.load_toc_index(slim.toc_index_path, slim.list_bundle_files()))
+        finally:
+            slim.toc_index_path = "toc_index.cache"
+
+    def test_export_packages(self):
+        logger.critical("Running test_export_packages...")
+        slim.slim_init(self.data_folder, self.cache_path)
+        output_folder = os.path.join(self.tmp.name, "export")
+        os.mkdir(output_folder)
+        exported = slim.export_packages(["0123456789abcdef", "fedcba9876543210", "0000000000000000"], output_folder, workers=2)
+        self.assertEqual(sorted(self.expected), sorted(exported))
+        for name, content in self.expected.items():
+            with open(os.path.join(output_folder, name), "rb") as f:
+                self.assertEqual(content, f.read())
+        # the exported chunks are not kept in the cache
+        self.assertEqual(0, slim.chunk_cache.size)
+        self.assertEqual(0, len(slim.chunk_cache.chunks))
+
+    def test_package_types(self):
+        logger.critical("Running test_package_types...")
+        with open(os.path.join(self.data_folder, "1111111111111111"), "wb") as f:
+            f.write(build_dsar([(build_toc([]), True, True)]))
+        with open(os.path.join(self.data_folder, "2222222222222222"), "wb") as f:
+            f.write(build_toc([]))
+        slim.slim_init(self.data_folder, self.cache_path)
+        self.assertTrue(slim.is_slim_version())
+        self.assertEqual(slim.BUNDLED, slim.get_package_type(os.path.join(self.data_folder, "0123456789abcdef")))
+        self.assertEqual(slim.DSAR, slim.get_package_type(os.path.join(self.data_folder, "1111111111111111")))
+        self.assertEqual(slim.LEGACY, slim.get_package_type(os.path.join(self.data_folder, "2222222222222222")))
+        self.assertEqual(
+            {"0123456789abcdef": slim.BUNDLED, "1111111111111111": slim.DSAR, "2222222222222222": slim.LEGACY},
+            slim.package_types
+        )
+
+        # files written after the data folder was listed are still found, and are only cached once they exist
+        patch_path = os.path.join(self.data_folder, "2222222222222222.patch_0")
+        self.assertEqual(slim.BUNDLED, slim.get_package_type(patch_path))
+        self.assertFalse(slim.package_file_exists(patch_path))
+        with open(patch_path, "wb") as f:
+            f.write(build_toc([]))
+        self.assertTrue(slim.package_file_exists(patch_path))
+        self.assertEqual(slim.LEGACY, slim.get_package_type(patch_path))
+        self.assertEqual(slim.LEGACY, slim.package_types["2222222222222222.patch_0"])
+
+        # packages outside the data folder are not cached
+        outside_path = os.path.join(self.tmp.name, "2222222222222222")
+        with open(outside_path, "wb") as f:
+            f.write(build_dsar([(build_toc([]), True, True)]))
+        self.assertEqual(slim.DSAR, slim.get_package_type(outside_path))
+        self.assertEqual(4, len(slim.package_types))
+
+    def test_package_table(self):
+        logger.critical("Running test_package_table...")
+        names = b"aaaa\x00bb\x00"
+        items = [(0, 0x40, 1), (0x100, 0x80, 0), (0, 0x10, 2), (0x200, 0x20, 3)]
+        table = bytearray(0x18 + 0x18 * 3)
+        items_offset = len(table) + len(names)
+        struct.pack_into("<II", table, 0x0C, 4, 3)
+        # the second record of "aaaa" adds its entries to the first one
+        struct.pack_into("<QIII", table, 0x18, 0x300, len(table), 2, items_offset)
+        struct.pack_into("<QIII", table, 0x30, 0x50, len(table) + 5, 1, items_offset + 0x20)
+        struct.pack_into("<QIII", table, 0x48, 0x999, len(table), 1, items_offset + 0x30)
+        table += names + b"".join([struct.pack("<QI3xB", *item) for item in items])
+        with open(os.path.join(self.data_folder, "bundles.nxa"), "wb") as f:
+            f.write(build_dsar([(bytes(table), True, True)]))
+        slim.game_data_folder = self.data_folder
+        slim.build_bundle_mapping([])
+
+        self.assertEqual(["aaaa", "bb"], sorted(slim.package_contents))
+        package = slim.package_contents["aaaa"]
+        self.assertEqual(0x300, package.size)
+        self.assertEqual([(0, 0x100, 0x40, 1), (0x100, 0x100, 0x80, 0), (0x200, 0x100, 0x20, 3)], package.get_entries())
+        self.assertEqual([(0x100, 0x100, 0x80, 0)], package.get_entries(1, 2))
+        self.assertEqual([(0, 0x50, 0x10, 2)], slim.package_contents["bb"].get_entries())
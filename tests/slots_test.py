@@ -0,0 +1,91 @@
+import copy
+import gc
+import os
+import pickle
+import sys
+import tracemalloc
+import unittest
+
+import wwise_hierarchy_140
+import wwise_hierarchy_154
+
+from log import logger
+
+
+class TestSlots(unittest.TestCase):
+
+    def test_slotted_structs(self):
+        logger.critical("Running test_slotted_structs...")
+        for module in (wwise_hierarchy_154, wwise_hierarchy_140):
+            source = module.BankSourceStruct()
+            source.source_id = 1234
+            source.plugin_data = bytearray(b"plugin")
+            objects = [
+                source,
+                module.TrackInfoStruct(),
+                module.RTPCGraphPoint(0.5, 1.0, 4),
+                module.PlayListItem(10, 50000),
+                module.PropBundle(1, [3], [bytearray(4)]),
+                module.RangedPropBundle(1, [3], [(0.0, 1.0)]),
+            ]
+            for obj in objects:
+                self.assertFalse(hasattr(obj, "__dict__"), type(obj).__name__)
+                with self.assertRaises(AttributeError):
+                    obj.not_a_field = 0
+                # hierarchies are pickled to and from the bank parse workers
+                for clone in (pickle.loads(pickle.dumps(obj)), copy.deepcopy(obj)):
+                    self.assertEqual(obj.get_data(), clone.get_data())
+
+
+plain_classes = {}
+
+
+def unslotted_size(obj) -> int:
+    """
+    Size of obj plus its __dict__ if its class did not define __slots__
+    """
+    # one plain class per struct, so their instances share dict keys like the unslotted classes did
+    if type(obj) not in plain_classes:
+        plain_classes[type(obj)] = type(type(obj).__name__, (), {})
+    plain = plain_classes[type(obj)]()
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(obj, name):
+                setattr(plain, name, getattr(obj, name))
+    return sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)
+
+
+def benchmark(archive_path: str):
+    """
+    Bytes retained by a loaded archive, and how many of them are held by
+    instances of the structs with __slots__. The unslotted figures are what
+    the same instances take as plain objects with a __dict__
+    """
+    import core
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    archive = core.GameArchive.from_file(archive_path)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    names = {"TrackInfoStruct", "BankSourceStruct", "RTPCGraphPoint", "PlayListItem", "DidxEntry",
+             "TocHeader", "StringEntry", "PropBundle", "RangedPropBundle"}
+    counts = {}
+    struct_bytes = 0
+    unslotted_bytes = 0
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in names and type(obj).__module__ in ("core", "wwise_hierarchy_154", "wwise_hierarchy_140"):
+            counts[name] = counts.get(name, 0) + 1
+            struct_bytes += sys.getsizeof(obj) + (sys.getsizeof(obj.__dict__) if hasattr(obj, "__dict__") else 0)
+            unslotted_bytes += unslotted_size(obj)
+    print(f"{os.path.basename(archive_path)}: {len(archive.hierarchy_entries)} hierarchy entries, {sum(counts.values())} structs: {counts}")
+    print(f"unslotted: {retained - struct_bytes + unslotted_bytes} bytes retained, {unslotted_bytes} bytes in structs")
+    print(f"slotted:   {retained} bytes retained, {struct_bytes} bytes in structs")
+
+
+if __name__ == "__main__":
+    import env
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else os.path.join(env.get_data_path(), "9ba626afa44a3aa3"))
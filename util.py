@@ -1,15 +1,29 @@
+import numpy
 import os
 import struct
 import re
 
-from ctypes import c_uint32
 from math import ceil
-from typing import Any
+from typing import Any, Iterable
 from itertools import takewhile
 
+# compiled struct formats, shared by every stream
+struct_cache: dict[str, struct.Struct] = {}
+
+def get_struct(format: str) -> struct.Struct:
+    try:
+        return struct_cache[format]
+    except KeyError:
+        compiled = struct_cache[format] = struct.Struct(format)
+        return compiled
+
 class MemoryStream:
     '''
     Modified from https://github.com/kboykboy2/io_scene_helldivers2 with permission from kboykboy
+
+    buffer grows geometrically and may be longer than the stream; size is the
+    number of bytes written. data trims the spare capacity and returns the
+    buffer, getbuffer returns a view of the written bytes without copying
     '''
     def __init__(self, Data=b"", io_mode = "read"):
         self.location = 0
@@ -21,6 +35,31 @@ class MemoryStream:
         self.data = bytearray(Data)
         self.io_mode = io_mode
 
+    @property
+    def data(self):
+        if len(self.buffer) != self.size:
+            del self.buffer[self.size:]
+        return self.buffer
+
+    @data.setter
+    def data(self, data):
+        self.buffer = data
+        self.size = len(data)
+
+    def getbuffer(self) -> memoryview:
+        '''
+        The stream cannot grow while the returned view is alive
+        '''
+        return memoryview(self.buffer)[:self.size]
+
+    def reserve(self, size: int):
+        '''
+        Make room for at least size bytes, at least doubling the capacity
+        '''
+        capacity = len(self.buffer)
+        if size > capacity:
+            self.buffer += bytes(max(size, 2*capacity) - capacity)
+
     def set_read_mode(self):
         self.io_mode = "read"
 
@@ -35,42 +74,59 @@ class MemoryStream:
 
     def seek(self, location): # Go To Position In Stream
         self.location = location
-        if self.location > len(self.data):
-            missing_bytes = self.location - len(self.data)
-            self.data += bytearray(missing_bytes)
+        if self.location > self.size:
+            self.reserve(self.location)
+            self.size = self.location
 
     def tell(self): # Get Position In Stream
         return self.location
 
     def read(self, length=-1): # read Bytes From Stream
         if length == -1:
-            length = len(self.data) - self.location
-        if self.location + length > len(self.data):
+            length = self.size - self.location
+        if self.location + length > self.size:
             raise Exception("reading past end of stream")
 
-        newData = self.data[self.location:self.location+length]
+        newData = self.buffer[self.location:self.location+length]
         self.location += length
-        return bytearray(newData)
+        return newData
         
     def advance(self, offset):
         self.location += offset
         if self.location < 0:
             self.location = 0
-        if self.location > len(self.data):
-            missing_bytes = self.location - len(self.data)
-            self.data += bytearray(missing_bytes)
+        if self.location > self.size:
+            self.reserve(self.location)
+            self.size = self.location
 
     def write(self, bytes): # Write Bytes To Stream
-        length = len(bytes)
-        if self.location + length > len(self.data):
-            missing_bytes = (self.location + length) - len(self.data)
-            self.data += bytearray(missing_bytes)
-        self.data[self.location:self.location+length] = bytearray(bytes)
-        self.location += length
+        # bytes, bytearray and memoryview are copied straight into the buffer
+        end = self.location + len(bytes)
+        if end > len(self.buffer):
+            self.reserve(end)
+        self.buffer[self.location:end] = bytes
+        self.location = end
+        if end > self.size:
+            self.size = end
+
+    def read_struct(self, format: str) -> tuple:
+        '''
+        Unpack format at the current position straight from the buffer and
+        advance past it. format uses the stream's endianness unless it starts
+        with a byte order character, e.g. read_struct("<IIB")
+        '''
+        if format[0] not in "<>=!@":
+            format = self.endian+format
+        compiled = get_struct(format)
+        end = self.location + compiled.size
+        if end > self.size:
+            raise Exception("reading past end of stream")
+        values = compiled.unpack_from(self.buffer, self.location)
+        self.location = end
+        return values
 
     def read_format(self, format, size):
-        format = self.endian+format
-        return struct.unpack(format, self.read(size))[0]
+        return self.read_struct(format)[0]
         
     def bytes(self, value, size = -1):
         if size == -1:
@@ -86,31 +142,97 @@ class MemoryStream:
         return value
 
     def int8_read(self) -> int:
-        return self.read_format('b', 1)
+        return self.read_struct('b')[0]
 
     def uint8_read(self) -> int:
-        return self.read_format('B', 1)
+        return self.read_struct('B')[0]
 
     def int16_read(self) -> int:
-        return self.read_format('h', 2)
+        return self.read_struct('h')[0]
 
     def uint16_read(self) -> int:
-        return self.read_format('H', 2)
+        return self.read_struct('H')[0]
 
     def int32_read(self) -> int:
-        return self.read_format('i', 4)
+        return self.read_struct('i')[0]
 
     def uint32_read(self) -> int:
-        return self.read_format('I', 4)
+        return self.read_struct('I')[0]
 
     def int64_read(self) -> int:
-        return self.read_format('q', 8)
+        return self.read_struct('q')[0]
 
     def uint64_read(self) -> int:
-        return self.read_format('Q', 8)
+        return self.read_struct('Q')[0]
 
     def float_read(self) -> float:
-        return self.read_format('f', 4)
+        return self.read_struct('f')[0]
+
+class MemoryViewStream(MemoryStream):
+    '''
+    Read-only MemoryStream over an existing buffer. Reads return memoryviews into
+    the buffer instead of copies, so parsed data stays a view until it is replaced
+    '''
+    def __init__(self, Data=b""):
+        self.location = 0
+        self.data = memoryview(Data)
+        self.io_mode = "read"
+        self.endian = "<"
+
+    def open(self, Data, io_mode = "read"):
+        self.data = memoryview(Data)
+
+    def set_write_mode(self):
+        raise Exception("stream is read-only")
+
+    def seek(self, location):
+        self.location = location
+
+    def read(self, length=-1) -> memoryview:
+        if length == -1:
+            length = self.size - self.location
+        if self.location + length > self.size:
+            raise Exception("reading past end of stream")
+
+        newData = self.buffer[self.location:self.location+length]
+        self.location += length
+        return newData
+
+    def advance(self, offset):
+        self.location = max(self.location + offset, 0)
+
+    def write(self, bytes):
+        raise Exception("stream is read-only")
+
+class BufferList:
+    '''
+    Output assembled from a list of buffers and their total size. Buffers are
+    kept by reference instead of being joined, so large payloads are written
+    to the file as they are
+    '''
+    def __init__(self, buffers=()):
+        self.buffers: list[bytes | bytearray | memoryview] = []
+        self.size = 0
+        for data in buffers:
+            self.append(data)
+
+    def append(self, data):
+        if isinstance(data, BufferList):
+            self.buffers.extend(data.buffers)
+            self.size += data.size
+        else:
+            self.buffers.append(data)
+            self.size += len(data)
+
+    def __len__(self):
+        return self.size
+
+    def __bytes__(self):
+        return b"".join(self.buffers)
+
+    def write_to(self, f) -> int:
+        f.writelines(self.buffers)
+        return self.size
 
 def pad_to_16_byte_align(data):
     b = bytearray(data)
@@ -120,6 +242,20 @@ def pad_to_16_byte_align(data):
     
 def align_16_byte(addr: int) -> int:
     return ceil(addr/16)*16
+
+def write_16_byte_aligned(f, data) -> int:
+    """
+    Write data to a file followed by the zero padding that
+    pad_to_16_byte_align would add, without copying data
+    """
+    if isinstance(data, BufferList):
+        data.write_to(f)
+    else:
+        f.write(data)
+    padding = align_16_byte(len(data)) - len(data)
+    if padding:
+        f.write(bytes(padding))
+    return len(data) + padding
     
 def bytes_to_long(bytes):
     assert len(bytes) == 8
@@ -170,55 +306,82 @@ def alphanum_key(s):
     """
     return [ tryint(c) for c in re.split('([0-9]+)', s) ]
 
+MURMUR64_M = 0xc6a4a7935bd1e995
+MURMUR64_R = 47
+
+def group_by_length(items: list[bytes]) -> dict[int, list[int]]:
+    groups = {}
+    for index, item in enumerate(items):
+        try:
+            groups[len(item)].append(index)
+        except KeyError:
+            groups[len(item)] = [index]
+    return groups
+
 def murmur64_hash(data: Any, seed: int = 0):
 
-    m = 0xc6a4a7935bd1e995
-    r = 47
+    m = MURMUR64_M
+    r = MURMUR64_R
 
     MASK = 2 ** 64 - 1
 
-    data_as_bytes = bytearray(data)
+    data_as_bytes = memoryview(bytes(data))
+    length = len(data_as_bytes)
 
-    h = seed ^ ((m * len(data_as_bytes)) & MASK)
+    h = seed ^ ((m * length) & MASK)
 
-    off = int(len(data_as_bytes)/8)*8
-    for ll in range(0, off, 8):
-        k = bytes_to_long(data_as_bytes[ll:ll + 8])
+    off = length & ~7
+    for (k,) in struct.iter_unpack("<Q", data_as_bytes[:off]):
         k = (k * m) & MASK
-        k = k ^ ((k >> r) & MASK)
+        k = k ^ (k >> r)
         k = (k * m) & MASK
-        h = (h ^ k)
+        h = h ^ k
         h = (h * m) & MASK
 
-    l = len(data_as_bytes) & 7
-
-    if l >= 7:
-        h = (h ^ (data_as_bytes[off+6] << 48))
-
-    if l >= 6:
-        h = (h ^ (data_as_bytes[off+5] << 40))
-
-    if l >= 5:
-        h = (h ^ (data_as_bytes[off+4] << 32))
-
-    if l >= 4:
-        h = (h ^ (data_as_bytes[off+3] << 24))
-
-    if l >= 3:
-        h = (h ^ (data_as_bytes[off+2] << 16))
-
-    if l >= 2:
-        h = (h ^ (data_as_bytes[off+1] << 8))
-
-    if l >= 1:
-        h = (h ^ data_as_bytes[off])
+    # the tail bytes are xor-ed in little endian order, which is the same as
+    # xor-ing them in as one little endian integer
+    if length & 7:
+        h = h ^ int.from_bytes(data_as_bytes[off:], byteorder="little")
         h = (h * m) & MASK
 
-    h = h ^ ((h >> r) & MASK)
+    h = h ^ (h >> r)
     h = (h * m) & MASK
-    h = h ^ ((h >> r) & MASK)
+    h = h ^ (h >> r)
 
     return h
+
+def murmur64_hash_many(items: Iterable[Any], seed: int = 0) -> list[int]:
+    '''
+    murmur64_hash of every item, in order. Items of the same length are hashed
+    together as the rows of one array, a block column at a time
+    '''
+    items = [bytes(item) for item in items]
+    hashes = [0] * len(items)
+    m = numpy.uint64(MURMUR64_M)
+    r = numpy.uint64(MURMUR64_R)
+    for length, indices in group_by_length(items).items():
+        rows = numpy.frombuffer(b"".join([items[i] for i in indices]), dtype=numpy.uint8).reshape(len(indices), length)
+        h = numpy.full(len(indices), seed ^ ((MURMUR64_M * length) & 0xFFFFFFFFFFFFFFFF), dtype=numpy.uint64)
+        off = length & ~7
+        if off:
+            blocks = numpy.ascontiguousarray(rows[:, :off]).view("<u8")
+            for column in blocks.T:
+                k = column * m
+                k ^= k >> r
+                k *= m
+                h ^= k
+                h *= m
+        if length & 7:
+            tail = numpy.zeros((len(indices), 8), dtype=numpy.uint8)
+            tail[:, :length & 7] = rows[:, off:]
+            h ^= tail.view("<u8")[:, 0]
+            h *= m
+        h ^= h >> r
+        h *= m
+        h ^= h >> r
+        for index, value in zip(indices, h.tolist()):
+            hashes[index] = value
+    return hashes
 	
 def list_files_recursive(path: str = ".") -> list[str]:
     files = []
@@ -243,21 +406,37 @@ def strip_patch_index(filename):
     filename = ".".join(split)
     return filename
 
-_FNV_32_OFFSET_BASIS = c_uint32(2166136261)
-_FNV_32_PRIME = c_uint32(16777619)
-_FNV_30_MASK = c_uint32((1 << 30) - 1)
+_FNV_32_OFFSET_BASIS = 2166136261
+_FNV_32_PRIME = 16777619
+_FNV_30_MASK = (1 << 30) - 1
 
 
 def fnv_30(data: bytes):
     h = _FNV_32_OFFSET_BASIS
     for b in data:
-        b = c_uint32(b)
-        h = c_uint32(h.value * _FNV_32_PRIME.value)
-        h = c_uint32(h.value ^ b.value)
-    downshift = c_uint32(h.value >> 30)
-    mask = c_uint32(h.value & _FNV_30_MASK.value)
+        h = ((h * _FNV_32_PRIME) & 0xFFFFFFFF) ^ b
+
+    return (h >> 30) ^ (h & _FNV_30_MASK)
 
-    return c_uint32(downshift.value ^ mask.value).value
+
+def fnv_30_many(items: Iterable[bytes]) -> list[int]:
+    '''
+    fnv_30 of every item, in order. Items of the same length are hashed
+    together as the rows of one array, a byte column at a time
+    '''
+    items = [bytes(item) for item in items]
+    hashes = [0] * len(items)
+    prime = numpy.uint32(_FNV_32_PRIME)
+    for length, indices in group_by_length(items).items():
+        rows = numpy.frombuffer(b"".join([items[i] for i in indices]), dtype=numpy.uint8).reshape(len(indices), length)
+        h = numpy.full(len(indices), _FNV_32_OFFSET_BASIS, dtype=numpy.uint32)
+        for column in rows.T:
+            h *= prime
+            h ^= column
+        h = (h >> numpy.uint32(30)) ^ (h & numpy.uint32(_FNV_30_MASK))
+        for index, value in zip(indices, h.tolist()):
+            hashes[index] = value
+    return hashes
 
 
 def assert_equal(msg: str, expect, receive):
@@ -122,6 +122,9 @@ class HircEntry:
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
         if entry:
             for value in self.import_values:
                 try:
@@ -287,6 +290,9 @@ class MusicSegment(HircEntry):
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
         if entry:
             for value in self.import_values:
                 try:
@@ -447,6 +453,9 @@ class Action(HircEntry):
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
         if entry:
             for value in self.import_values:
                 try:
@@ -491,6 +500,16 @@ class Action(HircEntry):
 
 class TrackInfoStruct:
 
+    __slots__ = (
+        "track_id",
+        "source_id",
+        "event_id",
+        "play_at",
+        "begin_trim_offset",
+        "end_trim_offset",
+        "source_duration",
+    )
+
     def __init__(self):
         self.track_id = self.source_id = self.event_id = self.play_at = self.begin_trim_offset = self.end_trim_offset = self.source_duration = 0
 
@@ -1698,6 +1717,9 @@ class Event(HircEntry):
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
 
         if entry:
             for value in self.import_values:
@@ -1840,6 +1862,9 @@ class RandomSequenceContainer(HircEntry):
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
 
         if entry:
             for value in self.import_values:
@@ -1903,6 +1928,8 @@ class BankSourceStruct:
     plugin_contents plugin_size
     """
 
+    __slots__ = ("plugin_id", "stream_type", "source_id", "mem_size", "bit_flags", "plugin_size", "plugin_data")
+
     def __init__(self):
         self.plugin_id: int = 0
         self.stream_type: int = 0
@@ -1919,7 +1946,7 @@ class BankSourceStruct:
     def from_memory_stream(cls, stream: MemoryStream):
         b = BankSourceStruct()
         b.plugin_id, b.stream_type, b.source_id, b.mem_size, b.bit_flags = \
-            struct.unpack("<IBIIB", stream.read(14))
+            stream.read_struct("<IBIIB")
         if (b.plugin_id & 0x0F) == 2:
             if b.plugin_id:
                 b.plugin_size = stream.uint32_read()
@@ -2011,6 +2038,9 @@ class Sound(HircEntry):
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
 
         if entry:
             for value in self.import_values:
@@ -2084,6 +2114,10 @@ class HircEntryFactory:
 
 class WwiseHierarchy_140:
 
+    # entry types that are parsed on load even when the hierarchy is loaded
+    # lazily: everything that audio sources are attached to
+    eager_types = (0x02, 0x0A, 0x0B, 0x11)
+
     def __init__(self, soundbank=None):
         self.entries: dict[int, HircEntry] = {}
 
@@ -2099,12 +2133,37 @@ class WwiseHierarchy_140:
         self.music_switch_containers: list[MusicSwitchContainer] = []
         self.uncategorized: list[HircEntry] = []
 
+        # lazy loading: the raw HIRC chunk, the order of its entries and the
+        # entries that are not parsed yet, id -> (type, offset, size)
+        self.hierarchy_data: bytes | bytearray | memoryview = b""
+        self.entry_order: list[int] = []
+        self.pending_entries: dict[int, tuple[int, int, int]] = {}
+        # called with the hierarchy and the newly parsed entries whenever materialize parses
+        # entries, so the archive and mod holding the bank can merge them like eager entries
+        self.materialize_listeners: list = []
+
         self.soundbank = soundbank  # WwiseBank
         self.added_entries = {}
         self.removed_entries = {}
 
-    def load(self, hierarchy_data: bytes | bytearray):
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if isinstance(self.hierarchy_data, memoryview):
+            state["hierarchy_data"] = bytes(self.hierarchy_data)
+        return state
+
+    def load(self, hierarchy_data: bytes | bytearray | memoryview, lazy: bool = False):
+        """
+        With lazy set, only entries of eager_types are parsed. The rest stay in
+        hierarchy_data until the hierarchy is touched (get_entry, get_entries,
+        get_data or materialize)
+        """
         self.entries.clear()
+        self.pending_entries.clear()
+        self.entry_order.clear()
+        if lazy:
+            self._load_lazy(hierarchy_data)
+            return
         reader = MemoryStream()
         reader.write(hierarchy_data)
         reader.seek(0)
@@ -2121,6 +2180,87 @@ class WwiseHierarchy_140:
             if parent_id != None and parent_id in self.entries:
                 entry.parent = self.entries[parent_id]
 
+    def _load_lazy(self, hierarchy_data: bytes | bytearray | memoryview):
+        self.hierarchy_data = hierarchy_data
+        num_items = int.from_bytes(hierarchy_data[0:4], byteorder="little")
+        offset = 4
+        for _ in range(num_items):
+            hierarchy_type = hierarchy_data[offset]
+            size = int.from_bytes(hierarchy_data[offset+1:offset+5], byteorder="little")
+            hierarchy_id = int.from_bytes(hierarchy_data[offset+5:offset+9], byteorder="little")
+            if hierarchy_id not in self.pending_entries and hierarchy_id not in self.entries:
+                self.entry_order.append(hierarchy_id)
+            if hierarchy_type in self.eager_types:
+                self.pending_entries.pop(hierarchy_id, None)
+                entry = self._parse_entry(offset, size)
+                entry.soundbanks.append(self.soundbank)
+                if hierarchy_id in self.entries:
+                    self._remove_categorized_entry(self.entries[hierarchy_id])
+                self.entries[hierarchy_id] = entry
+                self._categorized_entry(entry)
+            else:
+                if hierarchy_id in self.entries:
+                    self._remove_categorized_entry(self.entries.pop(hierarchy_id))
+                self.pending_entries[hierarchy_id] = (hierarchy_type, offset, size)
+            offset += 5 + size
+
+        for entry in self.entries.values():
+            parent_id = entry.get_parent_id()
+            if parent_id != None and parent_id in self.entries:
+                entry.parent = self.entries[parent_id]
+
+    def _parse_entry(self, offset: int, size: int) -> HircEntry:
+        reader = MemoryStream(self.hierarchy_data[offset:offset+5+size])
+        return HircEntryFactory.from_memory_stream(reader)
+
+    def is_materialized(self) -> bool:
+        return len(self.pending_entries) == 0
+
+    def materialize(self) -> list[HircEntry]:
+        """
+        Parse the entries a lazy load left in hierarchy_data. Entries keep the
+        order of the HIRC chunk. Returns the newly parsed entries, after passing
+        them to materialize_listeners
+        """
+        if not self.pending_entries:
+            return []
+        new_entries = []
+        for hierarchy_id, (_, offset, size) in self.pending_entries.items():
+            entry = self._parse_entry(offset, size)
+            entry.soundbanks.append(self.soundbank)
+            new_entries.append(entry)
+        self.pending_entries.clear()
+        parsed = {entry.get_id(): entry for entry in new_entries}
+        entries = {}
+        for hierarchy_id in self.entry_order:
+            if hierarchy_id in self.entries:
+                entries[hierarchy_id] = self.entries[hierarchy_id]
+            elif hierarchy_id in parsed:
+                entries[hierarchy_id] = parsed[hierarchy_id]
+        for hierarchy_id, entry in self.entries.items():
+            if hierarchy_id not in entries:
+                entries[hierarchy_id] = entry
+        self.entries = entries
+        for entry in new_entries:
+            self._categorized_entry(entry)
+
+        # link parents, then pass on the modifications made to entries whose
+        # parent was not parsed yet
+        orphans = []
+        for entry in self.entries.values():
+            parent_id = entry.get_parent_id()
+            if entry.parent == None and parent_id != None and parent_id in self.entries:
+                entry.parent = self.entries[parent_id]
+                orphans.append(entry)
+        for entry in orphans:
+            for _ in range(int(entry.modified) + entry.modified_children):
+                entry.parent.raise_modified()
+        self.hierarchy_data = b""
+        self.entry_order.clear()
+        for listener in list(self.materialize_listeners):
+            listener(self, new_entries)
+        return new_entries
+
     def import_hierarchy(self, new_hierarchy: 'WwiseHierarchy_140'):
         for entry in new_hierarchy.get_entries():
             if isinstance(entry, (wwise_hierarchy_154.MusicSegment, wwise_hierarchy_154.MusicTrack, MusicSegment, MusicTrack)):
@@ -2172,9 +2312,11 @@ class WwiseHierarchy_140:
             entry.soundbanks.remove(self.soundbank)
 
     def has_entry(self, entry_id: int):
-        return entry_id in self.entries
+        return entry_id in self.entries or entry_id in self.pending_entries
 
     def get_entry(self, entry_id: int):
+        if entry_id in self.pending_entries:
+            self.materialize()
         return self.entries[entry_id]
 
     def get_actions(self):
@@ -2240,9 +2382,11 @@ class WwiseHierarchy_140:
         return self.music_switch_containers
 
     def get_entries(self):
+        self.materialize()
         return self.entries.values()
 
     def get_data(self):
+        self.materialize()
         old_child_lists = {}
         old_size = {}
         for mixer in self.get_actor_mixers() + self.get_switches_container() + self.get_random_sequence_containers() + self.get_layer_containers() + self.get_music_switch_containers():
@@ -2383,6 +2527,8 @@ class PropBundle:
     pValues[cProps] - cProps * tid / uni
     """
 
+    __slots__ = ("cProps", "pIDs", "pValues")
+
     def __init__(
             self,
             cProps: int = 0,
@@ -2400,11 +2546,10 @@ class PropBundle:
     def from_memory_stream(s: MemoryStream):
         p = PropBundle()
         p.cProps = s.uint8_read()
-        p.pIDs = [
-            s.uint8_read() for _ in range(p.cProps)
-        ]
+        p.pIDs = list(s.read_struct(f"<{p.cProps}B"))
+        values = s.read(4 * p.cProps)
         p.pValues = [
-            s.read(4) for _ in range(p.cProps)
+            values[i:i+4] for i in range(0, len(values), 4)
         ]
         return p
 
@@ -2535,6 +2680,8 @@ class RangedPropBundle:
     rangedValues[cProps] - cProps * (uni + uni)
     """
 
+    __slots__ = ("cProps", "pIDs", "rangedValues")
+
     def __init__(
             self,
             cProps: int = 0,
@@ -2552,13 +2699,9 @@ class RangedPropBundle:
     def from_memory_stream(s: MemoryStream):
         r = RangedPropBundle()
         r.cProps = s.uint8_read()
-        r.pIDs = [
-            s.uint8_read() for _ in range(r.cProps)
-        ]
-        r.rangedValues = [
-            (s.float_read(), s.float_read())
-            for _ in range(r.cProps)
-        ]
+        r.pIDs = list(s.read_struct(f"<{r.cProps}B"))
+        values = s.read_struct(f"<{2 * r.cProps}f")
+        r.rangedValues = list(zip(values[0::2], values[1::2]))
         return r
 
     def assert_range_prop_count(self, prop_count: int):
@@ -2878,6 +3021,8 @@ class RTPCGraphPoint:
     interp U32
     """
 
+    __slots__ = ("_from", "to", "interp")
+
     def __init__(self, _from: float = 0.0, to: float = 0.0, interp: int = 0):
         self._from = _from
         self.to = to
@@ -2977,40 +3122,28 @@ class BaseParam:
         # [Fx]
         baseParam = BaseParam()
 
-        baseParam.bIsOverrideParentFx = stream.uint8_read()
-        baseParam.uNumFx = stream.uint8_read()
+        baseParam.bIsOverrideParentFx, baseParam.uNumFx = stream.read_struct("<BB")
         if baseParam.uNumFx > 0:
             baseParam.bitsFxBypass = stream.uint8_read()
             baseParam.fxChunks = [
-                FxChunk(
-                    stream.uint8_read(),
-                    stream.uint32_read(),
-                    stream.uint8_read(),
-                    stream.uint8_read()
-                )
+                FxChunk(*stream.read_struct("<BIBB"))
                 for _ in range(baseParam.uNumFx)
             ]
 
         # [Metadata Fx]
-        baseParam.bIsOverrideParentMetadata = stream.uint8_read()
-        baseParam.uNumFxMetadata = stream.uint8_read()
+        baseParam.bIsOverrideParentMetadata, baseParam.uNumFxMetadata = stream.read_struct("<BB")
         if baseParam.uNumFxMetadata > 0:
             baseParam.fxChunksMetadata = [
-                FxChunkMetadata(
-                    stream.uint8_read(),
-                    stream.uint32_read(),
-                    stream.uint8_read()
-                )
+                FxChunkMetadata(*stream.read_struct("<BIB"))
                 for _ in range(baseParam.uNumFxMetadata)
             ]
 
-        baseParam.bOverrideAttachmentParams = stream.uint8_read()
-
-        baseParam.overrideBusId = stream.uint32_read()
-
-        baseParam.directParentID = stream.uint32_read()
-
-        baseParam.byBitVectorA = stream.uint8_read()
+        (
+            baseParam.bOverrideAttachmentParams,
+            baseParam.overrideBusId,
+            baseParam.directParentID,
+            baseParam.byBitVectorA
+        ) = stream.read_struct("<BIIB")
 
         # [Properties - No Modulator]
         baseParam.propBundle = PropBundle.from_memory_stream(stream)
@@ -3025,34 +3158,31 @@ class BaseParam:
         baseParam.auxParams.byBitVectorAux = stream.uint8_read()
         baseParam.auxParams.has_aux = baseParam.auxParams.byBitVectorAux & 0b0000_1000
         if baseParam.auxParams.has_aux:
-            auxIDs: list[int] = [stream.uint32_read() for _ in range(4)]
+            auxIDs: list[int] = list(stream.read_struct("<4I"))
             baseParam.auxParams.auxIDs = auxIDs
         baseParam.auxParams.reflectionAuxBus = stream.uint32_read()
 
         # [Adv Setting Params]
-        baseParam.advSetting.byBitVectorAdv = stream.uint8_read()
-        baseParam.advSetting.eVirtualQueueBehavior = stream.uint8_read()
-        baseParam.advSetting.u16MaxNumInstance = stream.uint16_read()
-        baseParam.advSetting.eBelowThresholdBehavior = stream.uint8_read()
-        baseParam.advSetting.byBitVectorHDR = stream.uint8_read()
+        (
+            baseParam.advSetting.byBitVectorAdv,
+            baseParam.advSetting.eVirtualQueueBehavior,
+            baseParam.advSetting.u16MaxNumInstance,
+            baseParam.advSetting.eBelowThresholdBehavior,
+            baseParam.advSetting.byBitVectorHDR
+        ) = stream.read_struct("<BBHBB")
 
         # [State]
         baseParam.stateParams.ulNumStateProps = stream.uint8_read()
         baseParam.stateParams.stateProps = [
-            StateProp(
-                stream.uint8_read(),
-                stream.uint8_read(),
-                stream.uint8_read()
-            ) for _ in range(baseParam.stateParams.ulNumStateProps)
+            StateProp(*stream.read_struct("<BBB"))
+            for _ in range(baseParam.stateParams.ulNumStateProps)
         ]
         baseParam.stateParams.ulNumStateGroups = stream.uint8_read()
         stateGroups: list[StateGroup] = []
         for _ in range(baseParam.stateParams.ulNumStateGroups):
-            ulStateGroupID = stream.uint32_read()
-            eStateSyncType = stream.uint8_read()
-            ulNumStates = stream.uint8_read()
+            ulStateGroupID, eStateSyncType, ulNumStates = stream.read_struct("<IBB")
             states: list[StateGroupState] = [
-                StateGroupState(stream.uint32_read(), stream.uint32_read())
+                StateGroupState(*stream.read_struct("<II"))
                 for _ in range(ulNumStates)
             ]
             stateGroups.append(StateGroup(
@@ -3067,19 +3197,10 @@ class BaseParam:
         baseParam.ulNumRTPC = stream.uint16_read()
         rtpcs: list[RTPC] = []
         for _ in range(baseParam.ulNumRTPC):
-            RTPCID = stream.uint32_read()
-            rtpcType = stream.uint8_read()
-            rtpcAccum = stream.uint8_read()
-            ParamID = stream.uint8_read()
-            rtpcCurveID = stream.uint32_read()
-            eScaling = stream.uint8_read()
-            ulSize = stream.uint16_read()
+            RTPCID, rtpcType, rtpcAccum, ParamID, rtpcCurveID, eScaling, ulSize = \
+                stream.read_struct("<IBBBIBH")
             RTPCGraphPoints: list[RTPCGraphPoint] = [
-                RTPCGraphPoint(
-                    stream.float_read(),
-                    stream.float_read(),
-                    stream.uint32_read()
-                )
+                RTPCGraphPoint(*stream.read_struct("<ffI"))
                 for _ in range(ulSize)
             ]
             rtpcs.append(RTPC(
@@ -3236,6 +3357,8 @@ class PlayListItem:
     weight s32
     """
 
+    __slots__ = ("ulPlayID", "weight")
+
     def __init__(self, ulPlayID: int, weight: int):
         self.ulPlayID = ulPlayID
         self.weight = weight
@@ -3323,6 +3446,9 @@ class LayerContainer(HircEntry):
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
 
         if entry:
             for value in self.import_values:
@@ -3432,6 +3558,9 @@ class ActorMixer(HircEntry):
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
 
         if entry:
             for value in self.import_values:
@@ -3717,6 +3846,9 @@ class SwitchContainer(HircEntry):
                 self.parent.raise_modified()
             for bank in self.soundbanks:
                 bank.raise_modified()
+        else:
+            for bank in self.soundbanks:
+                bank.invalidate()
 
         if entry:
             for value in self.import_values: